@@ -149,6 +149,11 @@ add_to_apps_screen = [
 # before_install = "epc_app.install.before_install"
 # after_install = "epc_app.install.after_install"
 
+# Runs after custom fields are synced, so indexes on them can be created
+after_migrate = [
+    "epc_app.noon_integration.setup.add_noon_indexes",
+]
+
 # Uninstallation
 # ------------
 
@@ -0,0 +1,583 @@
+# Frappe-free core of the Noon import: parsing helpers, per-source row
+# transforms, statement maps, staging aggregates and the reconciliation
+# arithmetic. Everything here works on plain iterables of dicts, so it can be
+# profiled on its own and run in worker processes; noon_import wraps it with
+# the database side.
+import datetime
+import hashlib
+import re
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from dateutil import parser as date_parser
+
+
+SOURCE_INVOICES = "Invoices & Credit Notes Report"
+SOURCE_TRANSACTIONS = "Transaction View Report"
+SOURCE_CONSOLIDATED = "Consolidated Item Level Fees Report"
+SOURCE_STATEMENT_DETAIL = "Noon Finance Web Statement Detail Report Noon"
+
+DATE_CANDIDATES = [
+    "Document Date",
+    "Transaction Date",
+    "Order Date",
+    "statement_date",
+    "last_statement_date",
+    "ordered_date",
+    "shipped_date",
+    "delivered_date",
+    "returned_date",
+]
+
+# Transaction View columns staged for order_update rows, so the adjustment
+# builders and reports never have to go back to the CSV
+ORDER_UPDATE_COMPONENTS = {
+    "net_proceeds": "Net Proceeds",
+    "referral_fee": "Referral Fee",
+    "fulfilment_logistics_fees": "Fullfilment & Logistics Fees",
+    "shipping_credits": "Shipping Credits",
+    "other_order_fees": "Other Order Fees",
+    "order_subsidies": "Order Subsidies",
+    "non_order_fees": "Non-Order Fees",
+    "non_order_subsidies": "Non-Order Subsidies",
+    "others": "Others",
+}
+
+
+def to_float(val) -> float:
+    # same rules as frappe.utils.flt
+    if val in (None, "", "None"):
+        return 0.0
+    if isinstance(val, str):
+        val = val.replace(",", "")
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def to_date(val) -> datetime.date | None:
+    # same rules as frappe.utils.getdate, minus the exception on bad input
+    if not val:
+        return None
+    if isinstance(val, datetime.datetime):
+        return val.date()
+    if isinstance(val, datetime.date):
+        return val
+
+    text = str(val)
+    if text.startswith(("0001-01-01", "0000-00-00")):
+        return None
+    try:
+        return date_parser.parse(text).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+# analyze_batch only needs the row count and the date range of each file, so
+# the date columns are located and their format is settled once per file
+# (date_columns), and every distinct date string is parsed once per worker.
+# Staging parses its date columns through the same memo.
+ISO_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?")
+DATE_MEMO_MAX = 65536
+
+_date_memo: Dict[str, datetime.date | None] = {}
+
+
+def _memo_date(key: str, parse) -> datetime.date | None:
+    try:
+        return _date_memo[key]
+    except KeyError:
+        pass
+
+    if len(_date_memo) >= DATE_MEMO_MAX:
+        _date_memo.clear()
+    value = _date_memo[key] = parse(key)
+    return value
+
+
+def _iso_date(text: str) -> datetime.date | None:
+    if text == "0001-01-01":
+        return None
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        # out-of-range ISO dates get the same treatment as elsewhere
+        return to_date(text)
+
+
+def parse_date(text: str | None) -> datetime.date | None:
+    # to_date for CSV values, memoized and with a fast path for ISO dates
+    if not text:
+        return None
+    match = ISO_DATE_RE.fullmatch(text)
+    if match:
+        return _memo_date(match.group(1), _iso_date)
+    return _memo_date(text, to_date)
+
+
+def date_columns(header: List[str], values: Iterable[tuple]) -> List[Tuple[int, bool]]:
+    # (column index, is ISO) for each DATE_CANDIDATES column in the header. A
+    # column is ISO when its first value in the sample is; other layouts go
+    # through to_date.
+    columns = []
+    values = list(values)
+
+    for idx, name in enumerate(header):
+        if name not in DATE_CANDIDATES:
+            continue
+        sample = next((row[idx] for row in values if idx < len(row) and row[idx]), "")
+        columns.append((idx, bool(ISO_DATE_RE.fullmatch(sample))))
+
+    return columns
+
+
+def scan_chunk(columns: List[Tuple[int, bool]], values: Iterable[tuple]) -> Dict[str, Any]:
+    count = 0
+    min_date = None
+    max_date = None
+
+    for row in values:
+        count += 1
+        width = len(row)
+
+        for idx, iso in columns:
+            text = row[idx] if idx < width else None
+            if not text:
+                continue
+
+            value = parse_date(text) if iso else _memo_date(text, to_date)
+            if value is None:
+                continue
+
+            if min_date is None or value < min_date:
+                min_date = value
+            if max_date is None or value > max_date:
+                max_date = value
+
+    return {"rows": count, "min_date": min_date, "max_date": max_date}
+
+
+def merge_scans(scans: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    count = 0
+    min_date = None
+    max_date = None
+
+    for scan in scans:
+        count += scan["rows"]
+        if scan["min_date"] and (min_date is None or scan["min_date"] < min_date):
+            min_date = scan["min_date"]
+        if scan["max_date"] and (max_date is None or scan["max_date"] > max_date):
+            max_date = scan["max_date"]
+
+    return {"rows": count, "min_date": min_date, "max_date": max_date}
+
+
+# Fee descriptions and reference numbers repeat heavily (a few hundred distinct
+# values per upload), so both are normalized through bounded LRU caches. The
+# hit counters are per process; transform_chunk hands its deltas back to the
+# parent for the step metrics.
+NORMALIZE_CACHE_SIZE = 8192
+
+WHITESPACE_RE = re.compile(r"\s+")
+STATEMENT_NR_RE = re.compile(r"(PS-[A-Za-z0-9\-]+)")
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_fee_text(text: str) -> str | None:
+    text = text.strip()
+
+    if text.startswith("PS-") and ":" in text:
+        text = text.split(":", 1)[1].strip()
+
+    text = WHITESPACE_RE.sub(" ", text).strip()
+    return text[:140] or None
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _find_statement_nr(text: str) -> str | None:
+    match = STATEMENT_NR_RE.search(text)
+    return match.group(1) if match else None
+
+
+def normalize_fee_key(value) -> str | None:
+    if not value:
+        return None
+    return _normalize_fee_text(str(value))
+
+
+def extract_statement_nr(*values) -> str | None:
+    for value in values:
+        if not value:
+            continue
+        statement_nr = _find_statement_nr(str(value))
+        if statement_nr:
+            return statement_nr
+    return None
+
+
+def normalization_stats() -> Dict[str, int]:
+    fee = _normalize_fee_text.cache_info()
+    statement = _find_statement_nr.cache_info()
+    return {"hits": fee.hits + statement.hits, "misses": fee.misses + statement.misses}
+
+
+# Row keys are the first 16 bytes of the sha256 of the key columns, as 32 hex
+# characters; keys staged before the switch were the full digest and are cut
+# down by the shorten_noon_source_row_keys patch.
+SOURCE_ROW_KEY_BYTES = 16
+
+
+def make_source_row_key(*values) -> str:
+    text = "\x1f".join("" if value is None else str(value).strip() for value in values)
+    return hashlib.sha256(text.encode("utf-8")).digest()[:SOURCE_ROW_KEY_BYTES].hex()
+
+
+def classify_order_update(net_proceeds: float) -> str:
+    if net_proceeds != 0:
+        return "commercial_adjustment"
+    return "logistics_adjustment"
+
+
+# Staged key of the normalized fee, in a schema's "key" list
+FEE_KEY = object()
+
+# One entry per Noon report, describing how a CSV line becomes a Noon Import
+# Row payload:
+#   document_type      constant, when the report has no document type column
+#   columns            payload field -> CSV column, copied as is
+#   key                CSV columns hashed into source_row_key, in order
+#   fee_key            CSV column normalized into fee_key, and the
+#                      (column, value) it is kept for; None keeps it always
+#   amounts            payload field -> CSV column parsed as float; None is 0
+#   dates              payload field -> CSV column parsed as date
+#   statement          CSV column holding the statement, or the columns it is
+#                      extracted from
+#   statement_map      (map name, payload fields) this report adds to the named
+#                      statement map: field value -> statement
+#   resolve_statement  (map name, payload field) lookups that take precedence
+#                      over the row's own statement; the reports feeding those
+#                      maps are staged first
+#   order_update       ORDER_UPDATE_COMPONENTS plus proposed_type, for lines of
+#                      this (column, value)
+REPORT_SCHEMAS = {
+    SOURCE_INVOICES: {
+        "columns": {
+            "invoice_nr": "Invoice Nr",
+            "creditnote_nr": "Credit Note Nr",
+            "reference_nr": "Source Doc Nr",
+            "order_nr": "Source Doc Nr",
+            "item_nr": "Source Doc Line Nr",
+            "transaction_type": "Transaction Type",
+            "document_type": "Document Type",
+            "partner_sku": "Partner SKU",
+        },
+        "key": [
+            "Document Type",
+            "Transaction Type",
+            "Invoice Nr",
+            "Credit Note Nr",
+            "Source Doc Nr",
+            "Source Doc Line Nr",
+            "Partner SKU",
+            FEE_KEY,
+            "Price Excluding VAT (Document Currency)",
+            "VAT Amount (Document Currency)",
+            "Price Including VAT (Document Currency)",
+        ],
+        "fee_key": ("Description", ("Transaction Type", "Statement Fee")),
+        "amounts": {
+            "amount": "Price Excluding VAT (Document Currency)",
+            "vat_amount": "VAT Amount (Document Currency)",
+            "gross_amount": "Price Including VAT (Document Currency)",
+        },
+        "statement": ["Source Doc Line Nr", "Source Doc Nr", "Description", "Misc"],
+        "resolve_statement": [
+            ("statement_map", "invoice_nr"),
+            ("statement_map", "creditnote_nr"),
+            ("order_statement_map", "order_nr"),
+        ],
+    },
+    SOURCE_TRANSACTIONS: {
+        "document_type": "Transaction View",
+        "columns": {
+            "reference_nr": "Reference Nr",
+            "order_nr": "Order Nr",
+            "transaction_type": "Transaction Type",
+            "partner_sku": "Partner SKUs",
+        },
+        "key": ["Reference Nr", "Order Nr", "Transaction Type", "Partner SKUs", FEE_KEY, "Total"],
+        "fee_key": ("Title", ("Transaction Type", "statement_fee")),
+        "amounts": {"amount": "Total", "vat_amount": None, "gross_amount": "Total"},
+        "dates": {"transaction_date": "Transaction Date"},
+        "statement": ["Reference Nr"],
+        "statement_map": ("order_statement_map", ["order_nr"]),
+        "order_update": ("Transaction Type", "order_update"),
+    },
+    SOURCE_CONSOLIDATED: {
+        "document_type": "Consolidated",
+        "columns": {
+            "invoice_nr": "invoice_nr",
+            "creditnote_nr": "creditnote_nr",
+            "order_nr": "order_nr",
+            "item_nr": "item_nr",
+            "transaction_type": "item_status",
+            "partner_sku": "partner_sku",
+        },
+        "key": [
+            "statement_nr",
+            "invoice_nr",
+            "creditnote_nr",
+            "order_nr",
+            "item_nr",
+            "item_status",
+            "partner_sku",
+            "total_payment",
+        ],
+        "amounts": {"amount": "total_payment", "vat_amount": None, "gross_amount": "total_payment"},
+        "statement": "statement_nr",
+        "statement_map": ("statement_map", ["invoice_nr", "creditnote_nr"]),
+    },
+    SOURCE_STATEMENT_DETAIL: {
+        "document_type": "Statement Detail",
+        "columns": {
+            "reference_nr": "reference_nr",
+            "order_nr": "order_nr",
+            "item_nr": "item_nr",
+            "transaction_type": "fee_name",
+            "partner_sku": "partner_sku",
+        },
+        "key": [
+            "statement_nr",
+            "reference_nr",
+            "order_nr",
+            "item_nr",
+            "fee_name",
+            "partner_sku",
+            "total_payment",
+        ],
+        "fee_key": ("fee_name", None),
+        "amounts": {"amount": "total_payment", "vat_amount": None, "gross_amount": "total_payment"},
+        "statement": "statement_nr",
+    },
+}
+
+
+def _pick(position: Dict[str, int], columns: List[Any]):
+    # Getter for several columns at once. Every row carries a trailing None
+    # that absent columns point at; the getter always returns a tuple and its
+    # last item is that None.
+    return itemgetter(*(position.get(column, -1) for column in columns), -1)
+
+
+@lru_cache(maxsize=64)
+def compile_schema(source_file: str, header: Tuple[str, ...]):
+    # REPORT_SCHEMAS entry + file header -> transform(values, idx, batch_name),
+    # turning one CSV value tuple into its staged payload
+    schema = REPORT_SCHEMAS[source_file]
+    width = len(header)
+    position = {column: i for i, column in enumerate(header)}
+    padding = (None,) * (width + 1)
+
+    field_names = list(schema["columns"])
+    get_fields = _pick(position, list(schema["columns"].values()))
+
+    key_columns = schema["key"]
+    key_width = len(key_columns)
+    get_key = _pick(position, key_columns)
+    fee_slot = key_columns.index(FEE_KEY) if FEE_KEY in key_columns else None
+
+    fee_rule = schema.get("fee_key")
+    fee_at = position.get(fee_rule[0], -1) if fee_rule else None
+    fee_when = fee_rule and fee_rule[1]
+    fee_when_at = position.get(fee_when[0], -1) if fee_when else None
+
+    amount_names = list(schema["amounts"])
+    amount_at = [
+        None if column is None else position.get(column, -1)
+        for column in schema["amounts"].values()
+    ]
+    date_at = [(name, position.get(column, -1)) for name, column in (schema.get("dates") or {}).items()]
+
+    statement = schema["statement"]
+    if isinstance(statement, str):
+        statement_at = position.get(statement, -1)
+        get_statement_from = None
+    else:
+        statement_at = None
+        get_statement_from = _pick(position, statement)
+
+    order_update = schema.get("order_update")
+    if order_update:
+        order_update_at = position.get(order_update[0], -1)
+        component_at = [
+            (fieldname, position.get(column, -1))
+            for fieldname, column in ORDER_UPDATE_COMPONENTS.items()
+        ]
+
+    constants = {"source_file": source_file, "status": "Pending"}
+    if schema.get("document_type"):
+        constants["document_type"] = schema["document_type"]
+
+    def transform(values: tuple, idx: int, batch_name: str) -> Dict[str, Any]:
+        # short lines read as None for their missing columns, like DictReader
+        if len(values) < width:
+            row = (*values, *padding[len(values):])
+        else:
+            row = (*values, None)
+
+        payload = dict(zip(field_names, get_fields(row), strict=False))
+        payload.update(constants)
+        payload["batch"] = batch_name
+        payload["source_row_no"] = idx
+
+        key_values = get_key(row)[:key_width]
+        if fee_rule:
+            fee_key = normalize_fee_key(row[fee_at])
+            if fee_slot is not None:
+                key_values = (*key_values[:fee_slot], fee_key, *key_values[fee_slot + 1:])
+            if fee_when and row[fee_when_at] != fee_when[1]:
+                fee_key = None
+            payload["fee_key"] = fee_key
+        payload["source_row_key"] = make_source_row_key(*key_values)
+
+        for name, at in zip(amount_names, amount_at, strict=True):
+            payload[name] = 0.0 if at is None else to_float(row[at])
+        for name, at in date_at:
+            payload[name] = parse_date(row[at])
+
+        if get_statement_from:
+            payload["statement_nr"] = extract_statement_nr(*get_statement_from(row))
+        else:
+            payload["statement_nr"] = row[statement_at]
+
+        if order_update:
+            payload["proposed_type"] = None
+            if (row[order_update_at] or "").strip() == order_update[1]:
+                for fieldname, at in component_at:
+                    payload[fieldname] = to_float(row[at])
+                payload["proposed_type"] = classify_order_update(payload["net_proceeds"])
+
+        return payload
+
+    return transform
+
+
+def resolve_statement(
+    payload: Dict[str, Any],
+    maps: Dict[str, Dict[str, str]],
+    rules: List[Tuple[str, str]],
+) -> str | None:
+    for map_name, fieldname in rules:
+        statement_nr = maps.get(map_name, {}).get(payload.get(fieldname))
+        if statement_nr:
+            return statement_nr
+    return payload["statement_nr"]
+
+
+def transform_chunk(
+    source_file: str,
+    batch_name: str,
+    header: List[str],
+    values: Iterable[tuple],
+    start: int,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, str]], Dict[str, int]]:
+    # One parsed chunk of a source file -> (payloads, statement maps of the
+    # chunk, normalization cache hits/misses). Payloads get the statement found
+    # in their own columns; the caller applies the schema's resolve_statement
+    # once the maps are joined.
+    before = normalization_stats()
+    transform = compile_schema(source_file, tuple(header))
+    payloads = [transform(row, idx, batch_name) for idx, row in enumerate(values, start=start)]
+
+    maps = {}
+    statement_map = REPORT_SCHEMAS[source_file].get("statement_map")
+    if statement_map:
+        map_name, fieldnames = statement_map
+        out = maps[map_name] = {}
+        for payload in payloads:
+            statement_nr = payload["statement_nr"]
+            if not statement_nr:
+                continue
+            for fieldname in fieldnames:
+                value = payload.get(fieldname)
+                if value and value not in out:
+                    out[value] = statement_nr
+
+    after = normalization_stats()
+    normalized = {key: after[key] - before[key] for key in after}
+    return payloads, maps, normalized
+
+
+# Per-batch aggregates of the staged rows, accumulated while staging writes them
+# and stored on Noon Import Batch.staged_stats. The summary endpoints read them
+# instead of re-scanning the rows; editing or deleting a row clears them.
+class StagedStats:
+    def __init__(self):
+        self.rows = 0
+        self.by_source = Counter()
+        self.by_transaction_type = Counter()
+        self.by_document_type = Counter()
+        self.fee_keys = Counter()
+        self.statements = Counter()
+        self.item_skus = Counter()
+        self.mapping_fee_keys = Counter()
+
+    def add(self, row: Dict[str, Any], count: int = 1) -> None:
+        self.rows += count
+        self.by_source[row.get("source_file") or ""] += count
+        self.by_transaction_type[row.get("transaction_type") or ""] += count
+        self.by_document_type[row.get("document_type") or ""] += count
+
+        if row.get("fee_key"):
+            self.fee_keys[row["fee_key"]] += count
+        if row.get("statement_nr"):
+            self.statements[row["statement_nr"]] += count
+
+        if row.get("source_file") == SOURCE_INVOICES:
+            if row.get("transaction_type") == "Customer" and row.get("partner_sku"):
+                self.item_skus[row["partner_sku"]] += count
+            if row.get("transaction_type") == "Statement Fee" and row.get("fee_key"):
+                self.mapping_fee_keys[row["fee_key"]] += count
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "by_source": dict(self.by_source),
+            "by_transaction_type": dict(self.by_transaction_type),
+            "by_document_type": dict(self.by_document_type),
+            "fee_keys": dict(self.fee_keys),
+            "statements": dict(self.statements),
+            "item_skus": dict(self.item_skus),
+            "mapping_fee_keys": dict(self.mapping_fee_keys),
+        }
+
+
+def reconcile_statement(totals: Dict[str, Any]) -> Dict[str, Any]:
+    # totals: per-statement sums from the staged rows (see
+    # reconcile_batch_by_statement); missing sums count as zero
+    sales = totals.get("sales") or 0
+    returns = totals.get("returns") or 0
+    fee_payable = totals.get("fee_payable") or 0
+    fee_receivable = totals.get("fee_receivable") or 0
+
+    doc_expected = sales - abs(returns) - fee_payable + fee_receivable
+    tx_expected = (
+        (totals.get("order_total") or 0)
+        + (totals.get("order_update_total") or 0)
+        + (totals.get("statement_fee_total") or 0)
+        + (totals.get("balance_transfer_total") or 0)
+    )
+
+    return {
+        "statement_nr": totals.get("statement_nr"),
+        "sales": sales,
+        "returns": returns,
+        "fee_payable": fee_payable,
+        "fee_receivable": fee_receivable,
+        "doc_expected": doc_expected,
+        "tx_expected": tx_expected,
+        "difference": doc_expected - tx_expected,
+    }
@@ -1,12 +1,39 @@
 import hashlib
-import csv
-import io
-import re
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Iterable, Iterator
 
 import frappe
-from frappe.utils import cint, getdate, flt
-from frappe.utils.file_manager import get_file
+from frappe.utils import cint, flt
+from frappe.utils.background_jobs import is_job_enqueued
+from frappe.utils.file_manager import get_file_path
+
+from epc_app.noon_integration.api.noon_core import (
+    ORDER_UPDATE_COMPONENTS,
+    REPORT_SCHEMAS,
+    StagedStats,
+    date_columns,
+    extract_statement_nr,
+    merge_scans,
+    normalize_fee_key,
+    reconcile_statement,
+    resolve_statement,
+    scan_chunk,
+    transform_chunk,
+)
+from epc_app.noon_integration.api.noon_mapping_cache import (
+    clear_mapping_cache,
+    get_fee_map,
+    get_item_map,
+)
+from epc_app.noon_integration.api.noon_metrics import StepMetrics, add_normalize_stats
+from epc_app.noon_integration.api.noon_parallel import ChunkPool, parallel_workers
+from epc_app.noon_integration.api.noon_parse_cache import iter_csv_chunks
+from epc_app.noon_integration.api.noon_progress import (
+    report_rows,
+    report_step,
+    start_progress,
+    stop_progress,
+)
 
 
 SOURCE_LABELS = {
@@ -16,122 +43,30 @@ SOURCE_LABELS = {
     "statement_detail_file": "Noon Finance Web Statement Detail Report Noon",
 }
 
-DATE_CANDIDATES = [
-    "Document Date",
-    "Transaction Date",
-    "Order Date",
-    "statement_date",
-    "last_statement_date",
-    "ordered_date",
-    "shipped_date",
-    "delivered_date",
-    "returned_date",
-]
-
-
-def _read_attach_csv(file_url: str) -> List[Dict[str, Any]]:
-    if not file_url:
-        return []
-
-    _file_name, content = get_file(file_url)
-
-    if isinstance(content, bytes):
-        text = content.decode("utf-8-sig")
-    else:
-        text = content
-
-    reader = csv.DictReader(io.StringIO(text))
-    return [dict(row) for row in reader]
-
-
-def _collect_dates(rows: List[Dict[str, Any]]) -> List:
-    out = []
-
-    for row in rows:
-        for key in DATE_CANDIDATES:
-            val = row.get(key)
-            if not val:
-                continue
-            try:
-                out.append(getdate(val))
-            except Exception:
-                pass
-
-    return out
-
-
-def _to_float(val) -> float:
-    if val in (None, "", "None"):
-        return 0.0
-    try:
-        return flt(val)
-    except Exception:
-        return 0.0
-
-
-def _normalize_fee_key(value) -> str | None:
-    if not value:
-        return None
-
-    text = str(value).strip()
-
-    if text.startswith("PS-") and ":" in text:
-        text = text.split(":", 1)[1].strip()
 
-    text = re.sub(r"\s+", " ", text).strip()
-    return text[:140] or None
-
-
-def _extract_statement_nr(*values) -> str | None:
-    for value in values:
-        if not value:
-            continue
-        match = re.search(r"(PS-[A-Za-z0-9\-]+)", str(value))
-        if match:
-            return match.group(1)
-    return None
-
-
-def _build_statement_map_from_consolidated(rows: List[Dict[str, Any]]) -> Dict[str, str]:
-    out = {}
-
-    for row in rows:
-        statement_nr = row.get("statement_nr")
-        invoice_nr = row.get("invoice_nr")
-        creditnote_nr = row.get("creditnote_nr")
-
-        if statement_nr and invoice_nr and invoice_nr not in out:
-            out[invoice_nr] = statement_nr
-
-        if statement_nr and creditnote_nr and creditnote_nr not in out:
-            out[creditnote_nr] = statement_nr
-
-    return out
-
-
-def _build_statement_map_from_transactions(rows: List[Dict[str, Any]]) -> Dict[str, str]:
-    out = {}
-
-    for row in rows:
-        statement_nr = _extract_statement_nr(row.get("Reference Nr"))
-        order_nr = row.get("Order Nr")
-
-        if statement_nr and order_nr and order_nr not in out:
-            out[order_nr] = statement_nr
-
-    return out
+def _iter_attach_chunks(files: Dict[str, str]) -> Iterator[tuple]:
+    # (fieldname, header, rows, first row no) for every parsed chunk of the
+    # attachments, in order. Parsed rows are cached by the attachment's content
+    # hash, so the pipeline steps parse each upload only once.
+    for fieldname, file_url in files.items():
+        start = 1
+        for header, values in iter_csv_chunks(file_url):
+            yield fieldname, header, values, start
+            start += len(values)
 
 
-def _make_source_row_key(*values) -> str:
-    normalized = []
+def _chunk_pool(files: Dict[str, str]) -> ChunkPool:
+    total_bytes = sum(os.path.getsize(get_file_path(file_url)) for file_url in files.values() if file_url)
+    return ChunkPool(parallel_workers(total_bytes))
 
-    for value in values:
-        if value is None:
-            normalized.append("")
-        else:
-            normalized.append(str(value).strip())
 
-    return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+def _iter_scan_tasks(files: Dict[str, str]) -> Iterator[tuple]:
+    # date columns and their format are settled on the first chunk of each file
+    columns = {}
+    for fieldname, header, values, _start in _iter_attach_chunks(files):
+        if fieldname not in columns:
+            columns[fieldname] = date_columns(header, values)
+        yield fieldname, (columns[fieldname], values)
 
 
 @frappe.whitelist()
@@ -147,18 +82,24 @@ def analyze_batch(batch_name: str):
 
     summary = {}
     all_dates = []
+    # running count and date range per file
+    scans = {fieldname: merge_scans([]) for fieldname in files}
+
+    with _chunk_pool(files) as pool:
+        for fieldname, scan in pool.map(scan_chunk, _iter_scan_tasks(files)):
+            report_rows(scan["rows"])
+            scans[fieldname] = merge_scans([scans[fieldname], scan])
 
     for fieldname, file_url in files.items():
-        rows = _read_attach_csv(file_url)
-        row_dates = _collect_dates(rows)
-        all_dates.extend(row_dates)
+        scan = scans[fieldname]
+        all_dates.extend(d for d in (scan["min_date"], scan["max_date"]) if d)
 
         summary[fieldname] = {
             "label": SOURCE_LABELS[fieldname],
-            "rows": len(rows),
+            "rows": scan["rows"],
             "attached": bool(file_url),
-            "min_date": str(min(row_dates)) if row_dates else None,
-            "max_date": str(max(row_dates)) if row_dates else None,
+            "min_date": str(scan["min_date"]) if scan["min_date"] else None,
+            "max_date": str(scan["max_date"]) if scan["max_date"] else None,
         }
 
     if all_dates:
@@ -177,311 +118,342 @@ def analyze_batch(batch_name: str):
     }
 
 
-def _insert_row(payload: Dict[str, Any]) -> bool:
-    exists = frappe.db.exists(
-        "Noon Import Row",
-        {
-            "source_file": payload.get("source_file"),
-            "source_row_key": payload.get("source_row_key"),
-        },
-    )
-    if exists:
-        return False
+STAGE_CHUNK_SIZE = 5000
+
+IMPORT_ROW_FIELDS = [
+    "batch",
+    "source_file",
+    "source_row_key",
+    "source_row_no",
+    "statement_nr",
+    "invoice_nr",
+    "creditnote_nr",
+    "reference_nr",
+    "order_nr",
+    "item_nr",
+    "transaction_type",
+    "document_type",
+    "partner_sku",
+    "fee_key",
+    "amount",
+    "vat_amount",
+    "gross_amount",
+    "status",
+    "transaction_date",
+    "proposed_type",
+    *ORDER_UPDATE_COMPONENTS,
+]
 
-    doc = frappe.get_doc({
-        "doctype": "Noon Import Row",
-        **payload,
-    })
-    doc.insert(ignore_permissions=True)
-    return True
+# Currency columns are NOT NULL; rows without order_update components get zeros
+IMPORT_ROW_DEFAULTS = dict.fromkeys(ORDER_UPDATE_COMPONENTS, 0.0)
+
+SEEN_ROW_KEY_FIELDS = [
+    "name",
+    "creation",
+    "modified",
+    "owner",
+    "modified_by",
+    "docstatus",
+    "idx",
+    "profile",
+    "source_file",
+    "source_row_key",
+    "batch",
+]
 
 
-def _stage_invoices_rows(
-    batch_name: str,
-    rows: List[Dict[str, Any]],
-    statement_map: Dict[str, str],
-    order_statement_map: Dict[str, str],
-) -> int:
-    count = 0
-
-    for idx, row in enumerate(rows, start=1):
-        source_doc_nr = row.get("Source Doc Nr")
-        source_doc_line_nr = row.get("Source Doc Line Nr")
-        source_row_key = _make_source_row_key(
-            row.get("Document Type"),
-            row.get("Transaction Type"),
-            row.get("Invoice Nr"),
-            row.get("Credit Note Nr"),
-            source_doc_nr,
-            source_doc_line_nr,
-            row.get("Partner SKU"),
-            _normalize_fee_key(row.get("Description")),
-            row.get("Price Excluding VAT (Document Currency)"),
-            row.get("VAT Amount (Document Currency)"),
-            row.get("Price Including VAT (Document Currency)"),
-        )
+# Buffers the staged rows of one source file and writes them with multi-row
+# inserts. Keys already seen in this run are dropped in memory, and keys already
+# stored by another batch are found with one query per chunk, not one per row.
+# With a profile, every staged key is also added to its Noon Seen Row Key
+# registry; incremental batches skip keys another batch registered there. Keys
+# are unique per source file across all batches, so while a line's row exists
+# the first query already finds it: the registry only matters for lines whose
+# rows have been deleted, by restaging or deleting their batch.
+class _ImportRowWriter:
+
+    def __init__(
+        self,
+        source_file: str,
+        stats: "StagedStats | None" = None,
+        chunk_size: int = STAGE_CHUNK_SIZE,
+        profile: str | None = None,
+        batch_name: str | None = None,
+        incremental: bool = False,
+    ):
+        self.source_file = source_file
+        self.stats = stats
+        self.chunk_size = chunk_size
+        self.profile = profile
+        self.batch_name = batch_name
+        self.incremental = incremental and bool(profile)
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # raw 16-byte digests of every key flushed in this run
+        self.seen = set()
+        self.inserted = 0
+        self.known = 0
+        self.user = frappe.session.user
+        self.now = frappe.utils.now_datetime()
+
+    def add(self, payload: Dict[str, Any]) -> None:
+        key = payload["source_row_key"]
+        if key in self.pending or bytes.fromhex(key) in self.seen:
+            return
+
+        self.pending[key] = payload
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+
+        existing = set(frappe.db.sql_list("""
+            select source_row_key
+            from `tabNoon Import Row`
+            where source_file = %s
+              and source_row_key in %s
+        """, (self.source_file, tuple(self.pending))))
+
+        registered = {}
+        if self.profile:
+            registered = dict(frappe.db.sql("""
+                select source_row_key, ifnull(batch, '')
+                from `tabNoon Seen Row Key`
+                where profile = %s
+                  and source_file = %s
+                  and source_row_key in %s
+            """, (self.profile, self.source_file, tuple(self.pending))))
+
+        if self.incremental:
+            existing.update(key for key, batch in registered.items() if batch != self.batch_name)
+
+        values = []
+        new_keys = []
+        for key, payload in self.pending.items():
+            self.seen.add(bytes.fromhex(key))
+            if key in existing:
+                continue
 
-        inserted = _insert_row({
-            "batch": batch_name,
-            "source_file": "Invoices & Credit Notes Report",
-            "source_row_key": source_row_key,
-            "source_row_no": idx,
-            "statement_nr": (
-                statement_map.get(row.get("Invoice Nr"))
-                or statement_map.get(row.get("Credit Note Nr"))
-                or order_statement_map.get(source_doc_nr)
-                or _extract_statement_nr(
-                    source_doc_line_nr,
-                    source_doc_nr,
-                    row.get("Description"),
-                    row.get("Misc"),
-                )
-            ),
-            "invoice_nr": row.get("Invoice Nr"),
-            "creditnote_nr": row.get("Credit Note Nr"),
-            "reference_nr": source_doc_nr,
-            "order_nr": source_doc_nr,
-            "item_nr": source_doc_line_nr,
-            "transaction_type": row.get("Transaction Type"),
-            "document_type": row.get("Document Type"),
-            "partner_sku": row.get("Partner SKU"),
-            "fee_key": _normalize_fee_key(row.get("Description")) if row.get("Transaction Type") == "Statement Fee" else None,
-            "amount": _to_float(row.get("Price Excluding VAT (Document Currency)")),
-            "vat_amount": _to_float(row.get("VAT Amount (Document Currency)")),
-            "gross_amount": _to_float(row.get("Price Including VAT (Document Currency)")),
-            "status": "Pending",
-        })
-        if inserted:
-            count += 1
+            if self.stats is not None:
+                self.stats.add(payload)
+            if key not in registered:
+                new_keys.append(key)
+
+            values.append((
+                frappe.generate_hash(length=10),
+                self.now,
+                self.now,
+                self.user,
+                self.user,
+                0,
+                0,
+                *(
+                    payload.get(fieldname, IMPORT_ROW_DEFAULTS.get(fieldname))
+                    for fieldname in IMPORT_ROW_FIELDS
+                ),
+            ))
+
+        if values:
+            frappe.db.bulk_insert(
+                "Noon Import Row",
+                ["name", "creation", "modified", "owner", "modified_by", "docstatus", "idx", *IMPORT_ROW_FIELDS],
+                values,
+                # keys stored before are filtered out above; a duplicate here
+                # is a concurrent staging run and fails this one
+                chunk_size=self.chunk_size,
+            )
 
-    return count
+        if new_keys and self.profile:
+            frappe.db.bulk_insert(
+                "Noon Seen Row Key",
+                SEEN_ROW_KEY_FIELDS,
+                [
+                    (
+                        frappe.generate_hash(length=10),
+                        self.now,
+                        self.now,
+                        self.user,
+                        self.user,
+                        0,
+                        0,
+                        self.profile,
+                        self.source_file,
+                        key,
+                        self.batch_name,
+                    )
+                    for key in new_keys
+                ],
+                chunk_size=self.chunk_size,
+            )
 
+        report_rows(len(self.pending))
+        self.inserted += len(values)
+        self.known += len(existing)
+        self.pending = {}
 
-def _stage_transactions_rows(batch_name: str, rows: List[Dict[str, Any]]) -> int:
-    count = 0
+    def close(self) -> int:
+        self.flush()
+        return self.inserted
 
-    for idx, row in enumerate(rows, start=1):
-        reference_nr = row.get("Reference Nr")
-        source_row_key = _make_source_row_key(
-            reference_nr,
-            row.get("Order Nr"),
-            row.get("Transaction Type"),
-            row.get("Partner SKUs"),
-            _normalize_fee_key(row.get("Title")),
-            row.get("Total"),
-        )
 
-        inserted = _insert_row({
-            "batch": batch_name,
-            "source_file": "Transaction View Report",
-            "source_row_key": source_row_key,
-            "source_row_no": idx,
-            "statement_nr": _extract_statement_nr(reference_nr),
-            "reference_nr": reference_nr,
-            "order_nr": row.get("Order Nr"),
-            "transaction_type": row.get("Transaction Type"),
-            "document_type": "Transaction View",
-            "partner_sku": row.get("Partner SKUs"),
-            "fee_key": _normalize_fee_key(row.get("Title")) if row.get("Transaction Type") == "statement_fee" else None,
-            "amount": _to_float(row.get("Total")),
-            "vat_amount": 0.0,
-            "gross_amount": _to_float(row.get("Total")),
-            "status": "Pending",
-        })
-        if inserted:
-            count += 1
+def _scan_staged_stats(batch_name: str) -> Dict[str, Any]:
+    stats = StagedStats()
 
-    return count
+    for row in frappe.db.sql("""
+        select
+            source_file,
+            transaction_type,
+            document_type,
+            fee_key,
+            statement_nr,
+            case
+                when source_file = 'Invoices & Credit Notes Report' and transaction_type = 'Customer'
+                then partner_sku
+            end as partner_sku,
+            count(*) as rows_count
+        from `tabNoon Import Row`
+        where batch = %s
+        group by 1, 2, 3, 4, 5, 6
+    """, (batch_name,), as_dict=True):
+        stats.add(row, count=row.rows_count)
 
+    return stats.as_dict()
 
-def _stage_consolidated_rows(batch_name: str, rows: List[Dict[str, Any]]) -> int:
-    count = 0
 
-    for idx, row in enumerate(rows, start=1):
-        source_row_key = _make_source_row_key(
-            row.get("statement_nr"),
-            row.get("invoice_nr"),
-            row.get("creditnote_nr"),
-            row.get("order_nr"),
-            row.get("item_nr"),
-            row.get("item_status"),
-            row.get("partner_sku"),
-            row.get("total_payment"),
-        )
+def _save_staged_stats(batch_name: str, stats: Dict[str, Any]) -> None:
+    frappe.db.set_value(
+        "Noon Import Batch",
+        batch_name,
+        "staged_stats",
+        frappe.as_json(stats),
+        update_modified=False,
+    )
 
-        inserted = _insert_row({
-            "batch": batch_name,
-            "source_file": "Consolidated Item Level Fees Report",
-            "source_row_key": source_row_key,
-            "source_row_no": idx,
-            "statement_nr": row.get("statement_nr"),
-            "invoice_nr": row.get("invoice_nr"),
-            "creditnote_nr": row.get("creditnote_nr"),
-            "order_nr": row.get("order_nr"),
-            "item_nr": row.get("item_nr"),
-            "transaction_type": row.get("item_status"),
-            "document_type": "Consolidated",
-            "partner_sku": row.get("partner_sku"),
-            "amount": _to_float(row.get("total_payment")),
-            "vat_amount": 0.0,
-            "gross_amount": _to_float(row.get("total_payment")),
-            "status": "Pending",
-        })
-        if inserted:
-            count += 1
 
-    return count
+def _get_staged_stats(batch_name: str, save: bool = False) -> Dict[str, Any]:
+    raw = frappe.db.get_value("Noon Import Batch", batch_name, "staged_stats")
+    if raw:
+        return frappe.parse_json(raw)
 
+    # missing or cleared because rows were touched outside staging. The
+    # whitelisted reads rebuild them in memory only; staging and the batch jobs
+    # are the ones that write the batch.
+    stats = _scan_staged_stats(batch_name)
+    if save:
+        _save_staged_stats(batch_name, stats)
+    return stats
 
-def _stage_statement_detail_rows(batch_name: str, rows: List[Dict[str, Any]]) -> int:
-    count = 0
 
-    for idx, row in enumerate(rows, start=1):
-        source_row_key = _make_source_row_key(
-            row.get("statement_nr"),
-            row.get("reference_nr"),
-            row.get("order_nr"),
-            row.get("item_nr"),
-            row.get("fee_name"),
-            row.get("partner_sku"),
-            row.get("total_payment"),
-        )
+def _counts_as_rows(counts: Dict[str, int], fieldname: str, by_count: bool = True) -> List[Dict[str, Any]]:
+    if by_count:
+        ordered = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    else:
+        ordered = sorted(counts.items())
+    return [{fieldname: key, "rows_count": count} for key, count in ordered]
 
-        inserted = _insert_row({
-            "batch": batch_name,
-            "source_file": "Noon Finance Web Statement Detail Report Noon",
-            "source_row_key": source_row_key,
-            "source_row_no": idx,
-            "statement_nr": row.get("statement_nr"),
-            "reference_nr": row.get("reference_nr"),
-            "order_nr": row.get("order_nr"),
-            "item_nr": row.get("item_nr"),
-            "transaction_type": row.get("fee_name"),
-            "document_type": "Statement Detail",
-            "partner_sku": row.get("partner_sku"),
-            "fee_key": _normalize_fee_key(row.get("fee_name")),
-            "amount": _to_float(row.get("total_payment")),
-            "vat_amount": 0.0,
-            "gross_amount": _to_float(row.get("total_payment")),
-            "status": "Pending",
-        })
-        if inserted:
-            count += 1
 
-    return count
+# Invoices go last: their statement is resolved against the maps built from the
+# consolidated and transaction files (REPORT_SCHEMAS), which are complete by the
+# time the first invoice chunk comes back from the pool.
+STAGE_FILE_ORDER = ["transactions_file", "consolidated_file", "statement_detail_file", "invoices_file"]
 
 
-@frappe.whitelist()
 def stage_batch_rows(batch_name: str):
     batch = frappe.get_doc("Noon Import Batch", batch_name)
 
     frappe.db.delete("Noon Import Row", {"batch": batch_name})
 
-    counts = {}
+    stats = StagedStats()
+    files = {fieldname: batch.get(fieldname) for fieldname in STAGE_FILE_ORDER}
+    writers = {
+        fieldname: _ImportRowWriter(
+            SOURCE_LABELS[fieldname],
+            stats,
+            profile=batch.profile,
+            batch_name=batch_name,
+            incremental=cint(batch.incremental),
+        )
+        for fieldname in files
+    }
 
-    invoices_rows = _read_attach_csv(batch.invoices_file)
-    transactions_rows = _read_attach_csv(batch.transactions_file)
-    consolidated_rows = _read_attach_csv(batch.consolidated_file)
-    statement_detail_rows = _read_attach_csv(batch.statement_detail_file)
+    maps = {}
 
-    statement_map = _build_statement_map_from_consolidated(consolidated_rows)
-    order_statement_map = _build_statement_map_from_transactions(transactions_rows)
+    with _chunk_pool(files) as pool:
+        tasks = (
+            (fieldname, (SOURCE_LABELS[fieldname], batch_name, header, values, start))
+            for fieldname, header, values, start in _iter_attach_chunks(files)
+        )
+        for fieldname, (payloads, chunk_maps, normalized) in pool.map(transform_chunk, tasks):
+            add_normalize_stats(normalized)
+
+            # chunks arrive in file order, so the first value still wins
+            for map_name, chunk_map in chunk_maps.items():
+                target = maps.setdefault(map_name, {})
+                for key, value in chunk_map.items():
+                    target.setdefault(key, value)
+
+            writer = writers[fieldname]
+            rules = REPORT_SCHEMAS[SOURCE_LABELS[fieldname]].get("resolve_statement")
+            for payload in payloads:
+                if rules:
+                    payload["statement_nr"] = resolve_statement(payload, maps, rules)
+                writer.add(payload)
 
-    counts["invoices_file"] = _stage_invoices_rows(batch_name, invoices_rows, statement_map, order_statement_map)
-    counts["transactions_file"] = _stage_transactions_rows(batch_name, transactions_rows)
-    counts["consolidated_file"] = _stage_consolidated_rows(batch_name, consolidated_rows)
-    counts["statement_detail_file"] = _stage_statement_detail_rows(batch_name, statement_detail_rows)
+    counts = {fieldname: writers[fieldname].close() for fieldname in SOURCE_LABELS}
 
     total_rows = sum(counts.values())
+    known_rows = sum(writer.known for writer in writers.values())
+    _save_staged_stats(batch_name, stats.as_dict())
+
+    # the builders' checkpoints describe the rows that were just replaced
+    frappe.db.set_value("Noon Import Batch", batch_name, {
+        "new_rows": total_rows,
+        "known_rows": known_rows,
+        "builder_checkpoints": None,
+    }, update_modified=False)
 
     frappe.db.commit()
 
     return {
         "batch": batch_name,
         "inserted_rows": total_rows,
+        "known_rows": known_rows,
         "breakdown": counts,
     }
 
 
 @frappe.whitelist()
-def summarize_staged_batch(batch_name: str):
-    by_source = frappe.db.sql("""
-        select source_file, count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s
-        group by source_file
-        order by source_file
-    """, (batch_name,), as_dict=True)
-
-    by_txn = frappe.db.sql("""
-        select ifnull(transaction_type, '') as transaction_type, count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s
-        group by transaction_type
-        order by rows_count desc, transaction_type asc
-    """, (batch_name,), as_dict=True)
-
-    by_doc = frappe.db.sql("""
-        select ifnull(document_type, '') as document_type, count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s
-        group by document_type
-        order by rows_count desc, document_type asc
-    """, (batch_name,), as_dict=True)
+def summarize_staged_batch(batch_name: str, fee_key: str | None = None, statement_nr: str | None = None):
+    stats = _get_staged_stats(batch_name)
 
-    fee_keys = frappe.db.sql("""
-        select fee_key, count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s and ifnull(fee_key, '') != ''
-        group by fee_key
-        order by rows_count desc, fee_key asc
-    """, (batch_name,), as_dict=True)
+    fee_keys = stats["fee_keys"]
+    statements = stats["statements"]
 
-    statements = frappe.db.sql("""
-        select statement_nr, count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s and ifnull(statement_nr, '') != ''
-        group by statement_nr
-        order by statement_nr asc
-    """, (batch_name,), as_dict=True)
+    # filters are normalized the way staging normalized the rows, so a raw Noon
+    # description or reference matches its staged key
+    if fee_key:
+        fee_key = normalize_fee_key(fee_key)
+        fee_keys = {key: count for key, count in fee_keys.items() if key == fee_key}
+    if statement_nr:
+        statement_nr = extract_statement_nr(statement_nr) or statement_nr.strip()
+        statements = {key: count for key, count in statements.items() if key == statement_nr}
 
     return {
         "batch": batch_name,
-        "by_source": by_source,
-        "by_transaction_type": by_txn,
-        "by_document_type": by_doc,
-        "fee_keys": fee_keys,
-        "statements": statements,
+        "by_source": _counts_as_rows(stats["by_source"], "source_file", by_count=False),
+        "by_transaction_type": _counts_as_rows(stats["by_transaction_type"], "transaction_type"),
+        "by_document_type": _counts_as_rows(stats["by_document_type"], "document_type"),
+        "fee_keys": _counts_as_rows(fee_keys, "fee_key"),
+        "statements": _counts_as_rows(statements, "statement_nr", by_count=False),
     }
 
 
 @frappe.whitelist()
 def get_required_mappings(batch_name: str):
-    item_rows = frappe.db.sql("""
-        select
-            partner_sku,
-            count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s
-          and source_file = 'Invoices & Credit Notes Report'
-          and transaction_type = 'Customer'
-          and ifnull(partner_sku, '') != ''
-        group by partner_sku
-        order by rows_count desc, partner_sku asc
-    """, (batch_name,), as_dict=True)
-
-    fee_rows = frappe.db.sql("""
-        select
-            fee_key,
-            count(*) as rows_count
-        from `tabNoon Import Row`
-        where batch = %s
-          and source_file = 'Invoices & Credit Notes Report'
-          and transaction_type = 'Statement Fee'
-          and ifnull(fee_key, '') != ''
-        group by fee_key
-        order by rows_count desc, fee_key asc
-    """, (batch_name,), as_dict=True)
+    stats = _get_staged_stats(batch_name)
+    item_rows = _counts_as_rows(stats["item_skus"], "partner_sku")
+    fee_rows = _counts_as_rows(stats["mapping_fee_keys"], "fee_key")
 
     company = frappe.db.get_value(
         "Noon Marketplace Profile",
@@ -489,29 +461,9 @@ def get_required_mappings(batch_name: str):
         "company",
     )
 
-    item_map = {
-        d.partner_sku: d.item_code
-        for d in frappe.get_all(
-            "Noon Item Mapping",
-            filters={"company": company, "is_active": 1},
-            fields=["partner_sku", "item_code"],
-            limit_page_length=0,
-        )
-    }
+    item_map = get_item_map(company)
 
-    fee_map = {
-        d.fee_key: {
-            "item_code": d.item_code,
-            "expense_account": d.expense_account,
-            "income_account": d.income_account,
-        }
-        for d in frappe.get_all(
-            "Noon Fee Mapping",
-            filters={"company": company, "is_active": 1},
-            fields=["fee_key", "item_code", "expense_account", "income_account"],
-            limit_page_length=0,
-        )
-    }
+    fee_map = get_fee_map(company)
 
     for row in item_rows:
         row["mapped_item_code"] = item_map.get(row["partner_sku"])
@@ -527,48 +479,48 @@ def get_required_mappings(batch_name: str):
     }
 
 
-def _column_exists(doctype: str, column: str) -> bool:
-    rows = frappe.db.sql(
-        f"show columns from `tab{doctype}` like %s",
-        (column,),
-    )
-    return bool(rows)
+# Columns on Item a partner SKU may match, in priority order
+ITEM_MATCH_COLUMNS = ("item_code", "custom_item_code_old")
+ITEM_MATCH_CHUNK = 5000
 
+_item_columns: Dict[str, bool] = {}
 
-def _sql_find_item_by_column(column: str, value: str):
-    if not _column_exists("Item", column):
-        return None
 
-    rows = frappe.db.sql(
-        f"""
-        select `name`, `item_name`
-        from `tabItem`
-        where `{column}` = %s
-        limit 1
-        """,
-        (value,),
-        as_dict=True,
-    )
-    return rows[0] if rows else None
+def _item_has_column(column: str) -> bool:
+    # Resolved once per worker from the cached DocType meta rather than with
+    # a `show columns` round trip per lookup.
+    if column not in _item_columns:
+        _item_columns[column] = column in ("name", "item_code") or frappe.get_meta("Item").has_field(column)
+    return _item_columns[column]
 
 
-def _find_item_for_partner_sku(partner_sku: str):
-    if not partner_sku:
-        return None
+def _find_items_for_partner_skus(partner_skus: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    pending = {sku for sku in partner_skus if sku}
+    found: Dict[str, Dict[str, Any]] = {}
 
-    for column in (
-        "item_code",
-        "custom_item_code_old",
-    ):
-        try:
-            item = _sql_find_item_by_column(column, partner_sku)
-        except Exception:
-            item = None
+    for column in ITEM_MATCH_COLUMNS:
+        if not pending or not _item_has_column(column):
+            continue
 
-        if item:
-            return item
+        values = sorted(pending)
+        for start in range(0, len(values), ITEM_MATCH_CHUNK):
+            rows = frappe.db.sql(
+                f"""
+                select `name`, `item_name`, `{column}` as match_value
+                from `tabItem`
+                where `{column}` in %s
+                order by `name`
+                """,
+                (tuple(values[start:start + ITEM_MATCH_CHUNK]),),
+                as_dict=True,
+            )
+            for row in rows:
+                found.setdefault(row.match_value, {"name": row.name, "item_name": row.item_name})
+
+        # a SKU matched on an earlier column keeps that match
+        pending -= set(found)
 
-    return None
+    return found
 
 
 @frappe.whitelist()
@@ -576,48 +528,64 @@ def auto_create_exact_item_mappings(batch_name: str):
     profile = frappe.db.get_value("Noon Import Batch", batch_name, "profile")
     company = frappe.db.get_value("Noon Marketplace Profile", profile, "company")
 
-    partner_skus = frappe.db.sql("""
-        select distinct partner_sku
-        from `tabNoon Import Row`
-        where batch = %s
-          and source_file = 'Invoices & Credit Notes Report'
-          and transaction_type = 'Customer'
-          and ifnull(partner_sku, '') != ''
-    """, (batch_name,), as_dict=True)
+    partner_skus = sorted(_get_staged_stats(batch_name)["item_skus"])
+
+    existing = _existing_names_by(
+        "Noon Item Mapping",
+        "partner_sku",
+        partner_skus,
+        filters={"company": company},
+    )
+    items = _find_items_for_partner_skus(sku for sku in partner_skus if sku not in existing)
 
     created = []
     skipped = []
+    values = []
+    user = frappe.session.user
+    now = frappe.utils.now_datetime()
 
-    for row in partner_skus:
-        partner_sku = row["partner_sku"]
-
-        if frappe.db.exists("Noon Item Mapping", {
-            "company": company,
-            "partner_sku": partner_sku,
-        }):
+    for partner_sku in partner_skus:
+        if partner_sku in existing:
             skipped.append({"partner_sku": partner_sku, "reason": "mapping_exists"})
             continue
 
-        item = _find_item_for_partner_sku(partner_sku)
+        item = items.get(partner_sku)
         if not item:
             skipped.append({"partner_sku": partner_sku, "reason": "item_not_found"})
             continue
 
-        doc = frappe.get_doc({
-            "doctype": "Noon Item Mapping",
-            "company": company,
-            "partner_sku": partner_sku,
-            "item_code": item["name"],
-            "item_name": item["item_name"],
-            "is_active": 1,
-        })
-        doc.insert(ignore_permissions=True)
-
+        values.append((
+            frappe.generate_hash(length=10),
+            now,
+            now,
+            user,
+            user,
+            0,
+            company,
+            partner_sku,
+            item["name"],
+            item["item_name"],
+            1,
+        ))
         created.append({
             "partner_sku": partner_sku,
             "item_code": item["name"],
         })
 
+    if values:
+        frappe.db.bulk_insert(
+            "Noon Item Mapping",
+            ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+             "company", "partner_sku", "item_code", "item_name", "is_active"],
+            values,
+            # SKUs already mapped are filtered out above; the unique
+            # (company, partner_sku) index fails the run if one was mapped
+            # in the meantime
+            chunk_size=ITEM_MATCH_CHUNK,
+        )
+        # bulk_insert skips the controller hooks that keep the cache current
+        clear_mapping_cache(company)
+
     frappe.db.commit()
 
     return {
@@ -635,72 +603,65 @@ def validate_batch_ready(batch_name: str):
     profile = frappe.db.get_value("Noon Import Batch", batch_name, "profile")
     company = frappe.db.get_value("Noon Marketplace Profile", profile, "company")
 
-    missing_item = frappe.db.sql("""
-        select distinct r.partner_sku
-        from `tabNoon Import Row` r
-        left join `tabNoon Item Mapping` m
-          on m.company = %s
-         and m.partner_sku = r.partner_sku
-         and ifnull(m.is_active, 0) = 1
-        where r.batch = %s
-          and r.source_file = 'Invoices & Credit Notes Report'
-          and r.transaction_type = 'Customer'
-          and ifnull(r.partner_sku, '') != ''
-          and m.name is null
-        order by r.partner_sku asc
-    """, (company, batch_name), as_dict=True)
+    stats = _get_staged_stats(batch_name)
 
-    missing_fee = frappe.db.sql("""
-        select distinct r.fee_key
-        from `tabNoon Import Row` r
-        left join `tabNoon Fee Mapping` m
-          on m.company = %s
-         and m.fee_key = r.fee_key
-         and ifnull(m.is_active, 0) = 1
-        where r.batch = %s
-          and r.source_file = 'Invoices & Credit Notes Report'
-          and r.transaction_type = 'Statement Fee'
-          and ifnull(r.fee_key, '') != ''
-          and (
-                m.name is null
-                or (
-                    ifnull(m.item_code, '') = ''
-                    and ifnull(m.expense_account, '') = ''
-                    and ifnull(m.income_account, '') = ''
-                )
-              )
-        order by r.fee_key asc
-    """, (company, batch_name), as_dict=True)
+    mapped_skus = get_item_map(company)
+    missing_item = [
+        {"partner_sku": partner_sku}
+        for partner_sku in sorted(stats["item_skus"])
+        if partner_sku not in mapped_skus
+    ]
+
+    fee_map = get_fee_map(company)
+    usable_fee_keys = {
+        fee_key
+        for fee_key, m in fee_map.items()
+        if m["item_code"] or m["expense_account"] or m["income_account"]
+    }
+
+    missing_fee = [
+        {"fee_key": fee_key}
+        for fee_key in sorted(stats["mapping_fee_keys"])
+        if fee_key not in usable_fee_keys
+    ]
 
     warehouse = frappe.db.get_value("Noon Marketplace Profile", profile, "warehouse")
 
     missing_stock = []
     if warehouse:
-        item_codes = [
-            d.item_code
-            for d in frappe.get_all(
-                "Noon Item Mapping",
-                filters={"company": company, "is_active": 1},
-                fields=["item_code"],
-                limit_page_length=0,
-            )
-        ]
-
-        item_codes = list(set([x for x in item_codes if x]))
-
-        for item_code in item_codes:
-            qty = frappe.db.get_value(
-                "Bin",
-                {"item_code": item_code, "warehouse": warehouse},
-                "actual_qty",
-            ) or 0
-
-            if qty <= 0:
-                missing_stock.append({
-                    "item_code": item_code,
-                    "warehouse": warehouse,
-                    "actual_qty": qty,
-                })
+        # Projected shortfall: what the batch's sales invoices will take out of
+        # the Noon warehouse per item, against the item's Bin, in one query.
+        missing_stock = frappe.db.sql("""
+            select
+                m.item_code,
+                %(warehouse)s as warehouse,
+                sum(s.required_qty) as required_qty,
+                ifnull(bin.actual_qty, 0) as actual_qty,
+                sum(s.required_qty) - ifnull(bin.actual_qty, 0) as shortfall_qty
+            from (
+                select partner_sku, count(*) as required_qty
+                from `tabNoon Import Row`
+                where batch = %(batch)s
+                  and source_file = 'Invoices & Credit Notes Report'
+                  and transaction_type = 'Customer'
+                  and document_type = 'Invoice'
+                  and ifnull(partner_sku, '') != ''
+                group by partner_sku
+            ) s
+            inner join `tabNoon Item Mapping` m
+              on m.company = %(company)s
+             and m.partner_sku = s.partner_sku
+             and ifnull(m.is_active, 0) = 1
+            inner join `tabItem` i
+              on i.name = m.item_code
+             and i.is_stock_item = 1
+            left join `tabBin` bin
+              on bin.item_code = m.item_code
+             and bin.warehouse = %(warehouse)s
+            group by m.item_code, bin.actual_qty
+            having sum(s.required_qty) > ifnull(bin.actual_qty, 0)
+            order by shortfall_qty desc, m.item_code asc
+        """, {"batch": batch_name, "company": company, "warehouse": warehouse}, as_dict=True)
 
     blocking_issues = []
     warnings = []
@@ -724,7 +685,7 @@ def validate_batch_ready(batch_name: str):
     if missing_stock:
         warnings.append({
             "type": "missing_stock_in_warehouse",
-            "message": "بعض الأصناف المربوطة لا تملك رصيدًا متاحًا في مستودع نون، لكن هذا لا يمنع إنشاء المسودات المالية.",
+            "message": "بعض الأصناف المطلوبة في الدفعة لا يكفي رصيدها في مستودع نون لتغطية فواتير المبيعات، لكن هذا لا يمنع إنشاء المسودات المالية.",
             "count": len(missing_stock),
             "rows": missing_stock,
         })
@@ -749,6 +710,163 @@ def validate_batch_ready(batch_name: str):
     }
 
 
+EXISTING_LOOKUP_CHUNK = 5000
+
+
+def _existing_names_by(
+    doctype: str,
+    fieldname: str,
+    values: Iterable[str],
+    filters: Dict[str, Any] | None = None,
+) -> Dict[str, str]:
+    # Idempotency lookups for a whole builder run: one IN query per doctype
+    # (chunked only for very large candidate sets) instead of one per group.
+    values = list({v for v in values if v})
+    out = {}
+
+    for start in range(0, len(values), EXISTING_LOOKUP_CHUNK):
+        for d in frappe.get_all(
+            doctype,
+            filters={**(filters or {}), fieldname: ["in", values[start:start + EXISTING_LOOKUP_CHUNK]]},
+            fields=["name", fieldname],
+            order_by="creation asc",
+            limit_page_length=0,
+        ):
+            out.setdefault(d[fieldname], d.name)
+
+    return out
+
+
+BUILDER_COMMIT_EVERY = 100
+# failed groups quoted in the run result
+BUILDER_FAILED_PREVIEW = 10
+
+
+def _load_checkpoints(batch_name: str, for_update: bool = False) -> Dict[str, Any]:
+    rows = frappe.db.sql(
+        f"""
+        select builder_checkpoints
+        from `tabNoon Import Batch`
+        where name = %s
+        {"for update" if for_update else ""}
+        """,
+        (batch_name,),
+    )
+    raw = rows[0][0] if rows else None
+    return frappe.parse_json(raw) if raw else {}
+
+
+def _save_checkpoint(batch_name: str, builder: str, checkpoint: Dict[str, Any] | None) -> None:
+    # locked read-modify-write: several builders may checkpoint the same batch.
+    # None drops the builder's checkpoint.
+    checkpoints = _load_checkpoints(batch_name, for_update=True)
+    if checkpoint is None:
+        if builder not in checkpoints:
+            return
+        checkpoints.pop(builder)
+    else:
+        checkpoints[builder] = checkpoint
+    frappe.db.set_value(
+        "Noon Import Batch",
+        batch_name,
+        "builder_checkpoints",
+        frappe.as_json(checkpoints),
+        update_modified=False,
+    )
+
+
+def _group_id(key) -> str:
+    # checkpoints store group keys as strings; composite keys are joined
+    if isinstance(key, str):
+        return key
+    return "\x1f".join("" if part is None else str(part) for part in key)
+
+
+def _build_in_chunks(batch_name: str, builder: str, iter_groups, build_group) -> Dict[str, Any]:
+    checkpoint = _load_checkpoints(batch_name).get(builder) or {}
+    retry_keys = set(checkpoint.get("failed") or [])
+
+    # Groups run in key order, so a checkpoint is "everything up to last_key".
+    # It also keeps a digest of the keys up to there: if staged groups were
+    # added or removed below last_key since, the builder starts over (the
+    # documents it already made are skipped as existing).
+    groups = sorted(
+        ((_group_id(key), key, payload) for key, payload in iter_groups()),
+        key=lambda group: group[0],
+    )
+
+    resume_key = checkpoint.get("last_key")
+    if resume_key is not None:
+        prefix = hashlib.sha256()
+        for group_id, _key, _payload in groups:
+            if group_id > resume_key:
+                break
+            prefix.update(group_id.encode("utf-8") + b"\x1e")
+        if prefix.hexdigest() != checkpoint.get("digest"):
+            resume_key = None
+
+    created = []
+    skipped = []
+    failed = []
+
+    digest = hashlib.sha256()
+    last_key = None
+    resumed = 0
+    since_commit = 0
+
+    def _checkpoint(done: bool = False):
+        # A run that got through every group without failures leaves nothing
+        # to resume: the next run starts over and rebuilds whatever documents
+        # are missing by then, as a run without checkpoints always did.
+        if done and not failed:
+            _save_checkpoint(batch_name, builder, None)
+            frappe.db.commit()
+            return
+
+        _save_checkpoint(batch_name, builder, {
+            "last_key": last_key,
+            "digest": digest.hexdigest(),
+            "failed": [d["group"] for d in failed],
+        })
+        frappe.db.commit()
+
+    for group_id, key, payload in groups:
+        digest.update(group_id.encode("utf-8") + b"\x1e")
+        last_key = group_id
+
+        if resume_key is not None and group_id <= resume_key and group_id not in retry_keys:
+            resumed += 1
+            continue
+
+        frappe.db.savepoint("noon_builder_group")
+        try:
+            build_group(key, payload, created, skipped)
+        except Exception as e:
+            frappe.db.rollback(save_point="noon_builder_group")
+            failed.append({"key": key, "group": group_id, "error": str(e)})
+
+        since_commit += 1
+        report_rows(1)
+
+        if since_commit >= BUILDER_COMMIT_EVERY:
+            _checkpoint()
+            since_commit = 0
+
+    _checkpoint(done=True)
+
+    return {
+        "batch": batch_name,
+        "created_count": len(created),
+        "skipped_count": len(skipped),
+        "failed_count": len(failed),
+        "resumed_from": resumed,
+        "created": created,
+        "skipped": skipped,
+        "failed": [{"key": d["key"], "error": d["error"]} for d in failed],
+        "failed_preview": [{"key": d["key"], "error": d["error"]} for d in failed[:BUILDER_FAILED_PREVIEW]],
+    }
+
+
 @frappe.whitelist()
 def build_sales_invoice_drafts(batch_name: str):
     profile_name = frappe.db.get_value("Noon Import Batch", batch_name, "profile")
@@ -771,15 +889,7 @@ def build_sales_invoice_drafts(batch_name: str):
         order by r.invoice_nr, r.partner_sku, r.amount
     """, (batch_name,), as_dict=True)
 
-    item_map = {
-        d.partner_sku: d.item_code
-        for d in frappe.get_all(
-            "Noon Item Mapping",
-            filters={"company": profile.company, "is_active": 1},
-            fields=["partner_sku", "item_code"],
-            limit_page_length=0,
-        )
-    }
+    item_map = get_item_map(profile.company)
 
     grouped = {}
     for row in invoice_rows:
@@ -787,14 +897,13 @@ def build_sales_invoice_drafts(batch_name: str):
         grouped.setdefault(inv, [])
         grouped[inv].append(row)
 
-    created = []
-    skipped = []
+    existing_invoices = _existing_names_by("Sales Invoice", "custom_noon_invoice_nr", grouped)
 
-    for invoice_nr, rows in grouped.items():
-        existing = frappe.db.exists("Sales Invoice", {"custom_noon_invoice_nr": invoice_nr})
+    def _build_group(invoice_nr, rows, created, skipped):
+        existing = existing_invoices.get(invoice_nr)
         if existing:
             skipped.append({"invoice_nr": invoice_nr, "reason": "already_exists", "sales_invoice": existing})
-            continue
+            return
 
         item_groups = {}
         for row in rows:
@@ -829,17 +938,12 @@ def build_sales_invoice_drafts(batch_name: str):
             })
 
         si.insert(ignore_permissions=True)
+        existing_invoices[invoice_nr] = si.name
         created.append({"invoice_nr": invoice_nr, "sales_invoice": si.name})
 
-    frappe.db.commit()
-
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
-    }
+    return _build_in_chunks(
+        batch_name, "build_sales_invoice_drafts", lambda: iter(grouped.items()), _build_group
+    )
 
 
 @frappe.whitelist()
@@ -870,31 +974,19 @@ def build_fee_receivable_sales_invoice_drafts(batch_name: str):
         order by r.invoice_nr, r.fee_key, r.amount
     """, (profile.company, batch_name), as_dict=True)
 
-    fee_map = {
-        d.fee_key: {
-            "item_code": d.item_code,
-            "income_account": d.income_account,
-        }
-        for d in frappe.get_all(
-            "Noon Fee Mapping",
-            filters={"company": profile.company, "is_active": 1},
-            fields=["fee_key", "item_code", "income_account"],
-            limit_page_length=0,
-        )
-    }
+    fee_map = get_fee_map(profile.company)
 
     grouped = {}
     for row in fee_rows:
         grouped.setdefault(row.invoice_nr, []).append(row)
 
-    created = []
-    skipped = []
+    existing_invoices = _existing_names_by("Sales Invoice", "custom_noon_fee_invoice_nr", grouped)
 
-    for invoice_nr, rows in grouped.items():
-        existing = frappe.db.exists("Sales Invoice", {"custom_noon_fee_invoice_nr": invoice_nr})
+    def _build_group(invoice_nr, rows, created, skipped):
+        existing = existing_invoices.get(invoice_nr)
         if existing:
             skipped.append({"invoice_nr": invoice_nr, "reason": "already_exists", "sales_invoice": existing})
-            continue
+            return
 
         si = frappe.get_doc({
             "doctype": "Sales Invoice",
@@ -923,17 +1015,12 @@ def build_fee_receivable_sales_invoice_drafts(batch_name: str):
             })
 
         si.insert(ignore_permissions=True)
+        existing_invoices[invoice_nr] = si.name
         created.append({"invoice_nr": invoice_nr, "sales_invoice": si.name})
 
-    frappe.db.commit()
-
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
-    }
+    return _build_in_chunks(
+        batch_name, "build_fee_receivable_sales_invoice_drafts", lambda: iter(grouped.items()), _build_group
+    )
 
 
 @frappe.whitelist()
@@ -1022,126 +1109,97 @@ def summarize_transaction_view_financials(batch_name: str):
 
 
 @frappe.whitelist()
-def reconcile_batch_by_statement(batch_name: str):
-    sales_rows = frappe.db.sql("""
-        select statement_nr, sum(gross_amount) as total
-        from `tabNoon Import Row`
-        where batch = %s
-          and source_file = 'Invoices & Credit Notes Report'
-          and transaction_type = 'Customer'
-          and document_type = 'Invoice'
-          and ifnull(statement_nr, '') != ''
-        group by statement_nr
-    """, (batch_name,), as_dict=True)
-
-    return_rows = frappe.db.sql("""
-        select statement_nr, sum(gross_amount) as total
-        from `tabNoon Import Row`
-        where batch = %s
-          and source_file = 'Invoices & Credit Notes Report'
-          and transaction_type = 'Customer'
-          and document_type = 'Creditnote'
-          and ifnull(statement_nr, '') != ''
-        group by statement_nr
-    """, (batch_name,), as_dict=True)
-
-    fee_payable_rows = frappe.db.sql("""
-        select r.statement_nr, sum(r.gross_amount) as total
-        from `tabNoon Import Row` r
-        inner join `tabNoon Fee Mapping` m
-          on m.company = %s
-         and m.fee_key = r.fee_key
-         and ifnull(m.is_active, 0) = 1
-         and m.direction = 'Payable to Noon'
-        where r.batch = %s
-          and r.source_file = 'Invoices & Credit Notes Report'
-          and r.transaction_type = 'Statement Fee'
-          and r.document_type = 'Invoice'
-          and ifnull(r.statement_nr, '') != ''
-        group by r.statement_nr
-    """, (
-        frappe.db.get_value(
-            "Noon Marketplace Profile",
-            frappe.db.get_value("Noon Import Batch", batch_name, "profile"),
-            "company",
-        ),
-        batch_name,
-    ), as_dict=True)
-
-    fee_receivable_rows = frappe.db.sql("""
-        select r.statement_nr, sum(r.gross_amount) as total
+def reconcile_batch_by_statement(
+    batch_name: str,
+    from_statement: str | None = None,
+    to_statement: str | None = None,
+    after_statement: str | None = None,
+    limit: int = 0,
+):
+    limit = cint(limit)
+
+    conditions = ["r.batch = %(batch)s", "ifnull(r.statement_nr, '') != ''"]
+    if from_statement:
+        conditions.append("r.statement_nr >= %(from_statement)s")
+    if to_statement:
+        conditions.append("r.statement_nr <= %(to_statement)s")
+    if after_statement:
+        conditions.append("r.statement_nr > %(after_statement)s")
+
+    # One pass over the batch's rows: every figure of the reconciliation is a
+    # conditional sum, and the fee direction comes from a single mapping join
+    # resolved through the batch's profile.
+    rows = frappe.db.sql(f"""
+        select
+            r.statement_nr,
+            sum(case
+                when r.source_file = 'Invoices & Credit Notes Report'
+                 and r.transaction_type = 'Customer'
+                 and r.document_type = 'Invoice'
+                then r.gross_amount else 0 end) as sales,
+            sum(case
+                when r.source_file = 'Invoices & Credit Notes Report'
+                 and r.transaction_type = 'Customer'
+                 and r.document_type = 'Creditnote'
+                then r.gross_amount else 0 end) as returns,
+            sum(case
+                when m.direction = 'Payable to Noon'
+                then r.gross_amount else 0 end) as fee_payable,
+            sum(case
+                when m.direction = 'Receivable from Noon'
+                then r.gross_amount else 0 end) as fee_receivable,
+            sum(case
+                when r.source_file = 'Transaction View Report' and r.transaction_type = 'order'
+                then r.amount else 0 end) as order_total,
+            sum(case
+                when r.source_file = 'Transaction View Report' and r.transaction_type = 'order_update'
+                then r.amount else 0 end) as order_update_total,
+            sum(case
+                when r.source_file = 'Transaction View Report' and r.transaction_type = 'statement_fee'
+                then r.amount else 0 end) as statement_fee_total,
+            sum(case
+                when r.source_file = 'Transaction View Report' and r.transaction_type = 'balance_transfer'
+                then r.amount else 0 end) as balance_transfer_total
         from `tabNoon Import Row` r
-        inner join `tabNoon Fee Mapping` m
-          on m.company = %s
+        inner join `tabNoon Import Batch` b
+          on b.name = r.batch
+        left join `tabNoon Marketplace Profile` p
+          on p.name = b.profile
+        left join `tabNoon Fee Mapping` m
+          on m.company = p.company
          and m.fee_key = r.fee_key
          and ifnull(m.is_active, 0) = 1
-         and m.direction = 'Receivable from Noon'
-        where r.batch = %s
-          and r.source_file = 'Invoices & Credit Notes Report'
-          and r.transaction_type = 'Statement Fee'
-          and r.document_type = 'Invoice'
-          and ifnull(r.statement_nr, '') != ''
+         and m.direction in ('Payable to Noon', 'Receivable from Noon')
+         and r.source_file = 'Invoices & Credit Notes Report'
+         and r.transaction_type = 'Statement Fee'
+         and r.document_type = 'Invoice'
+        where {" and ".join(conditions)}
+          and (
+                r.source_file = 'Transaction View Report'
+                or (
+                    r.source_file = 'Invoices & Credit Notes Report'
+                    and r.transaction_type = 'Customer'
+                    and r.document_type in ('Invoice', 'Creditnote')
+                )
+                or m.name is not null
+              )
         group by r.statement_nr
-    """, (
-        frappe.db.get_value(
-            "Noon Marketplace Profile",
-            frappe.db.get_value("Noon Import Batch", batch_name, "profile"),
-            "company",
-        ),
-        batch_name,
-    ), as_dict=True)
-
-    tx_rows = frappe.db.sql("""
-        select
-            statement_nr,
-            sum(case when transaction_type = 'order' then amount else 0 end) as order_total,
-            sum(case when transaction_type = 'order_update' then amount else 0 end) as order_update_total,
-            sum(case when transaction_type = 'statement_fee' then amount else 0 end) as statement_fee_total,
-            sum(case when transaction_type = 'balance_transfer' then amount else 0 end) as balance_transfer_total
-        from `tabNoon Import Row`
-        where batch = %s
-          and source_file = 'Transaction View Report'
-          and ifnull(statement_nr, '') != ''
-        group by statement_nr
-    """, (batch_name,), as_dict=True)
-
-    sales_map = {d.statement_nr: d.total or 0 for d in sales_rows}
-    return_map = {d.statement_nr: d.total or 0 for d in return_rows}
-    fee_payable_map = {d.statement_nr: d.total or 0 for d in fee_payable_rows}
-    fee_receivable_map = {d.statement_nr: d.total or 0 for d in fee_receivable_rows}
-    tx_map = {d.statement_nr: d for d in tx_rows}
+        order by r.statement_nr asc
+        {"limit %(limit)s" if limit else ""}
+    """, {
+        "batch": batch_name,
+        "from_statement": from_statement,
+        "to_statement": to_statement,
+        "after_statement": after_statement,
+        "limit": limit,
+    }, as_dict=True)
 
-    all_keys = sorted(set(sales_map) | set(return_map) | set(fee_payable_map) | set(fee_receivable_map) | set(tx_map))
-
-    out = []
-    for key in all_keys:
-        tx = tx_map.get(key, {})
-        doc_expected = (
-            (sales_map.get(key) or 0)
-            - abs(return_map.get(key) or 0)
-            - (fee_payable_map.get(key) or 0)
-            + (fee_receivable_map.get(key) or 0)
-        )
-        tx_expected = (
-            (tx.get("order_total") or 0)
-            + (tx.get("order_update_total") or 0)
-            + (tx.get("statement_fee_total") or 0)
-            + (tx.get("balance_transfer_total") or 0)
-        )
-        out.append({
-            "statement_nr": key,
-            "sales": sales_map.get(key) or 0,
-            "returns": return_map.get(key) or 0,
-            "fee_payable": fee_payable_map.get(key) or 0,
-            "fee_receivable": fee_receivable_map.get(key) or 0,
-            "doc_expected": doc_expected,
-            "tx_expected": tx_expected,
-            "difference": doc_expected - tx_expected,
-        })
+    out = [reconcile_statement(row) for row in rows]
 
     return {
         "batch": batch_name,
         "rows": out,
+        "next_after_statement": out[-1]["statement_nr"] if limit and len(out) == limit else None,
     }
 
 
@@ -1193,32 +1251,43 @@ def list_order_updates(batch_name: str):
     }
 
 
-@frappe.whitelist()
-def inspect_order_update_components(batch_name: str):
-    batch = frappe.get_doc("Noon Import Batch", batch_name)
-    rows = _read_attach_csv(batch.transactions_file)
+def _get_order_update_rows(batch_name: str, proposed_type: str | None = None) -> List[Dict[str, Any]]:
+    # served by the (batch, source_file, transaction_type, document_type) index
+    return frappe.db.sql(
+        f"""
+        select
+            reference_nr,
+            order_nr,
+            transaction_date,
+            partner_sku,
+            {", ".join(f"`{fieldname}`" for fieldname in ORDER_UPDATE_COMPONENTS)},
+            gross_amount as total,
+            proposed_type
+        from `tabNoon Import Row`
+        where batch = %(batch)s
+          and source_file = 'Transaction View Report'
+          and transaction_type = 'order_update'
+          {"and proposed_type = %(proposed_type)s" if proposed_type else ""}
+        order by source_row_no
+        """,
+        {"batch": batch_name, "proposed_type": proposed_type},
+        as_dict=True,
+    )
 
-    out = []
-    for row in rows:
-        if (row.get("Transaction Type") or "").strip() != "order_update":
-            continue
 
-        out.append({
-            "reference_nr": row.get("Reference Nr"),
-            "order_nr": row.get("Order Nr"),
-            "transaction_date": row.get("Transaction Date"),
-            "partner_sku": row.get("Partner SKUs"),
-            "net_proceeds": _to_float(row.get("Net Proceeds")),
-            "referral_fee": _to_float(row.get("Referral Fee")),
-            "fulfilment_logistics_fees": _to_float(row.get("Fullfilment & Logistics Fees")),
-            "shipping_credits": _to_float(row.get("Shipping Credits")),
-            "other_order_fees": _to_float(row.get("Other Order Fees")),
-            "order_subsidies": _to_float(row.get("Order Subsidies")),
-            "non_order_fees": _to_float(row.get("Non-Order Fees")),
-            "non_order_subsidies": _to_float(row.get("Non-Order Subsidies")),
-            "others": _to_float(row.get("Others")),
-            "total": _to_float(row.get("Total")),
-        })
+@frappe.whitelist()
+def inspect_order_update_components(batch_name: str):
+    out = [
+        {
+            "reference_nr": row.reference_nr,
+            "order_nr": row.order_nr,
+            "transaction_date": row.transaction_date,
+            "partner_sku": row.partner_sku,
+            **{fieldname: flt(row[fieldname]) for fieldname in ORDER_UPDATE_COMPONENTS},
+            "total": flt(row.total),
+        }
+        for row in _get_order_update_rows(batch_name)
+    ]
 
     return {
         "batch": batch_name,
@@ -1229,37 +1298,20 @@ def inspect_order_update_components(batch_name: str):
 
 @frappe.whitelist()
 def classify_order_updates(batch_name: str):
-    batch = frappe.get_doc("Noon Import Batch", batch_name)
-    rows = _read_attach_csv(batch.transactions_file)
-
-    out = []
-
-    for row in rows:
-        if (row.get("Transaction Type") or "").strip() != "order_update":
-            continue
-
-        net_proceeds = _to_float(row.get("Net Proceeds"))
-        referral_fee = _to_float(row.get("Referral Fee"))
-        fulfilment = _to_float(row.get("Fullfilment & Logistics Fees"))
-        order_subsidies = _to_float(row.get("Order Subsidies"))
-        total = _to_float(row.get("Total"))
-
-        if net_proceeds != 0:
-            proposed_type = "commercial_adjustment"
-        else:
-            proposed_type = "logistics_adjustment"
-
-        out.append({
-            "reference_nr": row.get("Reference Nr"),
-            "order_nr": row.get("Order Nr"),
-            "partner_sku": row.get("Partner SKUs"),
-            "net_proceeds": net_proceeds,
-            "referral_fee": referral_fee,
-            "fulfilment_logistics_fees": fulfilment,
-            "order_subsidies": order_subsidies,
-            "total": total,
-            "proposed_type": proposed_type,
-        })
+    out = [
+        {
+            "reference_nr": row.reference_nr,
+            "order_nr": row.order_nr,
+            "partner_sku": row.partner_sku,
+            "net_proceeds": flt(row.net_proceeds),
+            "referral_fee": flt(row.referral_fee),
+            "fulfilment_logistics_fees": flt(row.fulfilment_logistics_fees),
+            "order_subsidies": flt(row.order_subsidies),
+            "total": flt(row.total),
+            "proposed_type": row.proposed_type,
+        }
+        for row in _get_order_update_rows(batch_name)
+    ]
 
     return {
         "batch": batch_name,
@@ -1273,46 +1325,34 @@ def build_commercial_adjustment_returns(batch_name: str):
     profile_name = frappe.db.get_value("Noon Import Batch", batch_name, "profile")
     profile = frappe.get_doc("Noon Marketplace Profile", profile_name)
 
-    batch = frappe.get_doc("Noon Import Batch", batch_name)
-    tx_rows = _read_attach_csv(batch.transactions_file)
+    item_map = get_item_map(profile.company)
 
-    item_map = {
-        d.partner_sku: d.item_code
-        for d in frappe.get_all(
-            "Noon Item Mapping",
-            filters={"company": profile.company, "is_active": 1},
-            fields=["partner_sku", "item_code"],
-            limit_page_length=0,
-        )
-    }
+    groups = [
+        (f"{row.reference_nr}::{row.order_nr}", row)
+        for row in _get_order_update_rows(batch_name, "commercial_adjustment")
+    ]
 
-    created = []
-    skipped = []
-
-    for row in tx_rows:
-        if (row.get("Transaction Type") or "").strip() != "order_update":
-            continue
-
-        net_proceeds = _to_float(row.get("Net Proceeds"))
-        if net_proceeds == 0:
-            continue
+    existing_returns = _existing_names_by(
+        "Sales Invoice",
+        "custom_noon_reference_nr",
+        (f"{key}::commercial_adjustment" for key, _row in groups),
+        filters={"custom_noon_import_batch": batch_name, "is_return": 1},
+    )
 
-        order_nr = row.get("Order Nr")
-        partner_sku = row.get("Partner SKUs")
-        reference_nr = row.get("Reference Nr")
+    def _build_group(key, row, created, skipped):
+        net_proceeds = flt(row.net_proceeds)
+        order_nr = row.order_nr
+        partner_sku = row.partner_sku
+        reference_nr = row.reference_nr
 
-        existing = frappe.db.exists("Sales Invoice", {
-            "custom_noon_import_batch": batch_name,
-            "custom_noon_reference_nr": f"{reference_nr}::{order_nr}::commercial_adjustment",
-            "is_return": 1,
-        })
+        existing = existing_returns.get(f"{key}::commercial_adjustment")
         if existing:
             skipped.append({
                 "order_nr": order_nr,
                 "reason": "already_exists",
                 "sales_return": existing,
             })
-            continue
+            return
 
         item_code = item_map.get(partner_sku)
         if not item_code:
@@ -1321,7 +1361,7 @@ def build_commercial_adjustment_returns(batch_name: str):
                 "reason": "missing_item_mapping",
                 "partner_sku": partner_sku,
             })
-            continue
+            return
 
         si = frappe.get_doc({
             "doctype": "Sales Invoice",
@@ -1346,21 +1386,16 @@ def build_commercial_adjustment_returns(batch_name: str):
         })
 
         si.insert(ignore_permissions=True)
+        existing_returns[f"{key}::commercial_adjustment"] = si.name
         created.append({
             "order_nr": order_nr,
             "sales_return": si.name,
             "amount": abs(net_proceeds),
         })
 
-    frappe.db.commit()
-
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
-    }
+    return _build_in_chunks(
+        batch_name, "build_commercial_adjustment_returns", lambda: iter(groups), _build_group
+    )
 
 
 @frappe.whitelist()
@@ -1368,39 +1403,35 @@ def build_logistics_adjustment_purchase_invoices(batch_name: str):
     profile_name = frappe.db.get_value("Noon Import Batch", batch_name, "profile")
     profile = frappe.get_doc("Noon Marketplace Profile", profile_name)
 
-    batch = frappe.get_doc("Noon Import Batch", batch_name)
-    tx_rows = _read_attach_csv(batch.transactions_file)
-
-    created = []
-    skipped = []
-
     fee_item_code = "NOON-FEE-PAYABLE"
 
-    for row in tx_rows:
-        if (row.get("Transaction Type") or "").strip() != "order_update":
-            continue
+    groups = [
+        (f"{row.reference_nr}::{row.order_nr}", row)
+        for row in _get_order_update_rows(batch_name, "logistics_adjustment")
+    ]
 
-        net_proceeds = _to_float(row.get("Net Proceeds"))
-        if net_proceeds != 0:
-            continue
+    existing_invoices = _existing_names_by(
+        "Purchase Invoice",
+        "custom_noon_reference_nr",
+        (f"{key}::logistics_adjustment" for key, _row in groups),
+        filters={"custom_noon_import_batch": batch_name},
+    )
 
-        order_nr = row.get("Order Nr")
-        reference_nr = row.get("Reference Nr")
+    def _build_group(key, row, created, skipped):
+        order_nr = row.order_nr
+        reference_nr = row.reference_nr
 
-        fulfilment = abs(_to_float(row.get("Fullfilment & Logistics Fees")))
-        subsidy = _to_float(row.get("Order Subsidies"))
+        fulfilment = abs(flt(row.fulfilment_logistics_fees))
+        subsidy = flt(row.order_subsidies)
 
-        existing = frappe.db.exists("Purchase Invoice", {
-            "custom_noon_import_batch": batch_name,
-            "custom_noon_reference_nr": f"{reference_nr}::{order_nr}::logistics_adjustment",
-        })
+        existing = existing_invoices.get(f"{key}::logistics_adjustment")
         if existing:
             skipped.append({
                 "order_nr": order_nr,
                 "reason": "already_exists",
                 "purchase_invoice": existing,
             })
-            continue
+            return
 
         pi = frappe.get_doc({
             "doctype": "Purchase Invoice",
@@ -1437,6 +1468,7 @@ def build_logistics_adjustment_purchase_invoices(batch_name: str):
             })
 
         pi.insert(ignore_permissions=True)
+        existing_invoices[f"{key}::logistics_adjustment"] = pi.name
         created.append({
             "order_nr": order_nr,
             "purchase_invoice": pi.name,
@@ -1444,15 +1476,9 @@ def build_logistics_adjustment_purchase_invoices(batch_name: str):
             "subsidy": subsidy,
         })
 
-    frappe.db.commit()
-
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
-    }
+    return _build_in_chunks(
+        batch_name, "build_logistics_adjustment_purchase_invoices", lambda: iter(groups), _build_group
+    )
 
 
 @frappe.whitelist()
@@ -1466,8 +1492,10 @@ def build_payment_entry_drafts(batch_name: str):
             "batch": batch_name,
             "transaction_type": "payment",
         },
-        fields=["name", "reference_nr", "gross_amount"],
-        order_by="creation asc",
+        fields=["name", "reference_nr", "gross_amount", "transaction_date"],
+        # rows staged in one bulk insert share a creation timestamp; the row
+        # number keeps the order stable for the builder checkpoint
+        order_by="creation asc, source_file asc, source_row_no asc",
     )
 
     source_account = profile.settlement_clearing_account
@@ -1482,13 +1510,19 @@ def build_payment_entry_drafts(batch_name: str):
     source_currency = frappe.db.get_value("Account", source_account, "account_currency")
     target_currency = frappe.db.get_value("Account", target_account, "account_currency")
 
-    created = []
-    skipped = []
-
-    meta = frappe.get_meta("Noon Import Row")
-    has_transaction_date = any(df.fieldname == "transaction_date" for df in meta.fields)
+    existing_payments = _existing_names_by(
+        "Payment Entry",
+        "reference_no",
+        (row.reference_nr for row in payment_rows),
+        filters={
+            "company": profile.company,
+            "payment_type": "Receive",
+            "party_type": "Customer",
+            "party": profile.customer,
+        },
+    )
 
-    for row in payment_rows:
+    def _build_group(_key, row, created, skipped):
         reference_nr = row.get("reference_nr")
         amount = abs(flt(row.get("gross_amount")))
 
@@ -1497,7 +1531,7 @@ def build_payment_entry_drafts(batch_name: str):
                 "row": row.get("name"),
                 "reason": "missing_reference_nr",
             })
-            continue
+            return
 
         if not amount:
             skipped.append({
@@ -1505,18 +1539,9 @@ def build_payment_entry_drafts(batch_name: str):
                 "reference_nr": reference_nr,
                 "reason": "zero_amount",
             })
-            continue
+            return
 
-        existing = frappe.db.exists(
-            "Payment Entry",
-            {
-                "company": profile.company,
-                "payment_type": "Receive",
-                "party_type": "Customer",
-                "party": profile.customer,
-                "reference_no": reference_nr,
-            },
-        )
+        existing = existing_payments.get(reference_nr)
         if existing:
             skipped.append({
                 "row": row.get("name"),
@@ -1524,13 +1549,9 @@ def build_payment_entry_drafts(batch_name: str):
                 "reason": "already_exists",
                 "payment_entry": existing,
             })
-            continue
+            return
 
-        posting_date = frappe.utils.today()
-        if has_transaction_date:
-            txn_date = frappe.db.get_value("Noon Import Row", row.get("name"), "transaction_date")
-            if txn_date:
-                posting_date = txn_date
+        posting_date = row.get("transaction_date") or frappe.utils.today()
 
         pe = frappe.get_doc({
             "doctype": "Payment Entry",
@@ -1553,6 +1574,7 @@ def build_payment_entry_drafts(batch_name: str):
             "remarks": f"Noon settlement payment | Batch: {batch_name} | Ref: {reference_nr}",
         })
         pe.insert(ignore_permissions=True)
+        existing_payments[reference_nr] = pe.name
 
         created.append({
             "row": row.get("name"),
@@ -1561,15 +1583,12 @@ def build_payment_entry_drafts(batch_name: str):
             "amount": amount,
         })
 
-    frappe.db.commit()
-
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
-    }
+    return _build_in_chunks(
+        batch_name,
+        "build_payment_entry_drafts",
+        lambda: ((row.name, row) for row in payment_rows),
+        _build_group,
+    )
 
 
 @frappe.whitelist()
@@ -1660,28 +1679,19 @@ def build_sales_return_drafts(batch_name: str):
         order by r.creditnote_nr, r.partner_sku, r.amount
     """, (batch_name,), as_dict=True)
 
-    item_map = {
-        d.partner_sku: d.item_code
-        for d in frappe.get_all(
-            "Noon Item Mapping",
-            filters={"company": profile.company, "is_active": 1},
-            fields=["partner_sku", "item_code"],
-            limit_page_length=0,
-        )
-    }
+    item_map = get_item_map(profile.company)
 
     grouped = {}
     for row in credit_rows:
         grouped.setdefault(row.creditnote_nr, []).append(row)
 
-    created = []
-    skipped = []
+    existing_returns = _existing_names_by("Sales Invoice", "custom_noon_creditnote_nr", grouped)
 
-    for creditnote_nr, rows in grouped.items():
-        existing = frappe.db.exists("Sales Invoice", {"custom_noon_creditnote_nr": creditnote_nr})
+    def _build_group(creditnote_nr, rows, created, skipped):
+        existing = existing_returns.get(creditnote_nr)
         if existing:
             skipped.append({"creditnote_nr": creditnote_nr, "reason": "already_exists", "sales_invoice": existing})
-            continue
+            return
 
         item_groups = {}
         for row in rows:
@@ -1716,17 +1726,12 @@ def build_sales_return_drafts(batch_name: str):
             })
 
         si.insert(ignore_permissions=True)
+        existing_returns[creditnote_nr] = si.name
         created.append({"creditnote_nr": creditnote_nr, "sales_return": si.name})
 
-    frappe.db.commit()
-
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
-    }
+    return _build_in_chunks(
+        batch_name, "build_sales_return_drafts", lambda: iter(grouped.items()), _build_group
+    )
 
 
 @frappe.whitelist()
@@ -1756,31 +1761,19 @@ def build_fee_purchase_invoice_drafts(batch_name: str):
         order by r.invoice_nr, r.fee_key, r.amount
     """, (profile.company, batch_name), as_dict=True)
 
-    fee_map = {
-        d.fee_key: {
-            "item_code": d.item_code,
-            "expense_account": d.expense_account,
-        }
-        for d in frappe.get_all(
-            "Noon Fee Mapping",
-            filters={"company": profile.company, "is_active": 1},
-            fields=["fee_key", "item_code", "expense_account"],
-            limit_page_length=0,
-        )
-    }
+    fee_map = get_fee_map(profile.company)
 
     grouped = {}
     for row in fee_rows:
         grouped.setdefault(row.invoice_nr, []).append(row)
 
-    created = []
-    skipped = []
+    existing_invoices = _existing_names_by("Purchase Invoice", "custom_noon_fee_invoice_nr", grouped)
 
-    for invoice_nr, rows in grouped.items():
-        existing = frappe.db.exists("Purchase Invoice", {"custom_noon_fee_invoice_nr": invoice_nr})
+    def _build_group(invoice_nr, rows, created, skipped):
+        existing = existing_invoices.get(invoice_nr)
         if existing:
             skipped.append({"invoice_nr": invoice_nr, "reason": "already_exists", "purchase_invoice": existing})
-            continue
+            return
 
         pi = frappe.get_doc({
             "doctype": "Purchase Invoice",
@@ -1809,73 +1802,597 @@ def build_fee_purchase_invoice_drafts(batch_name: str):
             })
 
         pi.insert(ignore_permissions=True)
+        existing_invoices[invoice_nr] = pi.name
         created.append({"invoice_nr": invoice_nr, "purchase_invoice": pi.name})
 
-    frappe.db.commit()
+    return _build_in_chunks(
+        batch_name, "build_fee_purchase_invoice_drafts", lambda: iter(grouped.items()), _build_group
+    )
 
-    return {
-        "batch": batch_name,
-        "created_count": len(created),
-        "skipped_count": len(skipped),
-        "created": created,
-        "skipped": skipped,
+
+PIPELINE_STEPS = [
+    "analyze_batch",
+    "stage_batch_rows",
+    "auto_create_item_mappings",
+    "validate_batch_ready",
+    "build_sales_invoice_drafts",
+    "build_sales_return_drafts",
+    "build_fee_purchase_invoice_drafts",
+    "build_fee_receivable_sales_invoice_drafts",
+    "build_commercial_adjustment_returns",
+    "build_logistics_adjustment_purchase_invoices",
+    "build_payment_entry_drafts",
+    "summarize_batch_financials",
+    "summarize_transaction_view_financials",
+    "reconcile_batch_by_statement",
+]
+
+
+def _run_step(results: Dict[str, Any], step: str, fn, batch_name: str):
+    report_step(step)
+    with StepMetrics(batch_name, step) as metrics:
+        results[step] = fn(batch_name)
+        metrics.set_result(results[step])
+    return results[step]
+
+
+# Each node of the pipeline graph runs as one background job. A runner fills
+# `results` and returns False to stop the pipeline (batch not ready).
+def _step_runner(step: str, fn):
+    def run(batch_name: str, results: Dict[str, Any]) -> bool:
+        _run_step(results, step, fn, batch_name)
+        return True
+
+    return run
+
+
+def _run_validate(batch_name: str, results: Dict[str, Any]) -> bool:
+    # store rebuilt stats once here so the reads below reuse them
+    _get_staged_stats(batch_name, save=True)
+    validation = _run_step(results, "validate_batch_ready", validate_batch_ready, batch_name)
+    if validation.get("ready"):
+        return True
+
+    blocking_issues = validation.get("blocking_issues") or []
+    has_missing_item_mappings = any(
+        issue.get("type") == "missing_item_mappings"
+        for issue in blocking_issues
+    )
+
+    if has_missing_item_mappings:
+        mapping_report = get_required_mappings(batch_name)
+        unresolved_item_mappings = [
+            row for row in (mapping_report.get("item_mappings_needed") or [])
+            if not row.get("mapped_item_code")
+        ]
+        results["missing_item_mapping_report"] = mapping_report
+        results["unresolved_item_mappings_count"] = len(unresolved_item_mappings)
+        results["unresolved_item_mappings_preview"] = unresolved_item_mappings[:20]
+        return False
+
+    if blocking_issues:
+        frappe.throw(blocking_issues[0].get("message"))
+    frappe.throw("الدفعة غير جاهزة لإنشاء المسودات المطلوبة.")
+
+
+def _run_summaries(batch_name: str, results: Dict[str, Any]) -> bool:
+    _run_step(results, "summarize_batch_financials", summarize_batch_financials, batch_name)
+    _run_step(
+        results,
+        "summarize_transaction_view_financials",
+        summarize_transaction_view_financials,
+        batch_name,
+    )
+    _run_step(results, "reconcile_batch_by_statement", reconcile_batch_by_statement, batch_name)
+    return True
+
+
+PIPELINE_BUILDERS = {
+    "build_sales_invoice_drafts": build_sales_invoice_drafts,
+    "build_sales_return_drafts": build_sales_return_drafts,
+    "build_fee_purchase_invoice_drafts": build_fee_purchase_invoice_drafts,
+    "build_fee_receivable_sales_invoice_drafts": build_fee_receivable_sales_invoice_drafts,
+    "build_commercial_adjustment_returns": build_commercial_adjustment_returns,
+    "build_logistics_adjustment_purchase_invoices": build_logistics_adjustment_purchase_invoices,
+    "build_payment_entry_drafts": build_payment_entry_drafts,
+}
+
+PIPELINE_RUNNERS = {
+    "analyze_batch": _step_runner("analyze_batch", analyze_batch),
+    "stage_batch_rows": _step_runner("stage_batch_rows", stage_batch_rows),
+    "auto_create_item_mappings": _step_runner("auto_create_item_mappings", auto_create_exact_item_mappings),
+    "validate_batch_ready": _run_validate,
+    **{step: _step_runner(step, fn) for step, fn in PIPELINE_BUILDERS.items()},
+    "summaries": _run_summaries,
+}
+
+
+# Builders that create the same doctype take their names from the same naming
+# series and would only queue on its tabSeries row lock, so each doctype is one
+# chain of jobs. The chains run side by side: the builder phase takes as long as
+# the slowest chain instead of the sum of all builders, so the saving is the
+# Purchase Invoice and Payment Entry time hidden behind the Sales Invoice chain
+# (the per-step wall times in Noon Import Batch Metric give it for a batch).
+PIPELINE_BUILDER_CHAINS = [
+    [
+        "build_sales_invoice_drafts",
+        "build_sales_return_drafts",
+        "build_fee_receivable_sales_invoice_drafts",
+        "build_commercial_adjustment_returns",
+    ],
+    [
+        "build_fee_purchase_invoice_drafts",
+        "build_logistics_adjustment_purchase_invoices",
+    ],
+    ["build_payment_entry_drafts"],
+]
+
+
+def _pipeline_graph(include_payments: int) -> Dict[str, List[str]]:
+    # step -> steps it waits for. Every builder chain starts after validation;
+    # "summaries" joins their last steps.
+    graph = {
+        "analyze_batch": [],
+        "stage_batch_rows": ["analyze_batch"],
+        "auto_create_item_mappings": ["stage_batch_rows"],
+        "validate_batch_ready": ["auto_create_item_mappings"],
     }
+    chain_ends = []
+    for chain in PIPELINE_BUILDER_CHAINS:
+        previous = "validate_batch_ready"
+        for step in chain:
+            if step == "build_payment_entry_drafts" and not include_payments:
+                continue
+            graph[step] = [previous]
+            previous = step
+        if previous != "validate_batch_ready":
+            chain_ends.append(previous)
+
+    graph["summaries"] = chain_ends
+    return graph
+
+
+def _ready_steps(state: Dict[str, Any]) -> List[str]:
+    if state.get("stopped"):
+        return []
+
+    done = {step for step, status in state["steps"].items() if status == "done"}
+    return [
+        step for step, deps in state["graph"].items()
+        if step not in state["steps"] and all(dep in done for dep in deps)
+    ]
 
 
-@frappe.whitelist()
 def run_full_draft_pipeline(batch_name: str, include_payments: int = 0):
+    # In-process run of the pipeline graph, one step after the other
     include_payments = cint(include_payments)
+    state = {"graph": _pipeline_graph(include_payments), "steps": {}}
     results = {}
 
-    results["analyze_batch"] = analyze_batch(batch_name)
-    results["stage_batch_rows"] = stage_batch_rows(batch_name)
-    results["auto_create_item_mappings"] = auto_create_exact_item_mappings(batch_name)
+    while ready := _ready_steps(state):
+        for step in ready:
+            if not PIPELINE_RUNNERS[step](batch_name, results):
+                state["stopped"] = True
+            state["steps"][step] = "done"
 
-    validation = validate_batch_ready(batch_name)
-    results["validate_batch_ready"] = validation
+    return {
+        "batch": batch_name,
+        "include_payments": include_payments,
+        "results": results,
+    }
 
-    if not validation.get("ready"):
-        blocking_issues = validation.get("blocking_issues") or []
-        has_missing_item_mappings = any(
-            issue.get("type") == "missing_item_mappings"
-            for issue in blocking_issues
-        )
 
-        if has_missing_item_mappings:
-            mapping_report = get_required_mappings(batch_name)
-            unresolved_item_mappings = [
-                row for row in (mapping_report.get("item_mappings_needed") or [])
-                if not row.get("mapped_item_code")
-            ]
-            results["missing_item_mapping_report"] = mapping_report
-            results["unresolved_item_mappings_count"] = len(unresolved_item_mappings)
-            results["unresolved_item_mappings_preview"] = unresolved_item_mappings[:20]
-            return {
-                "batch": batch_name,
-                "include_payments": include_payments,
-                "results": results,
-            }
-
-        if blocking_issues:
-            frappe.throw(blocking_issues[0].get("message"))
-        frappe.throw("الدفعة غير جاهزة لإنشاء المسودات المطلوبة.")
-
-    results["build_sales_invoice_drafts"] = build_sales_invoice_drafts(batch_name)
-    results["build_sales_return_drafts"] = build_sales_return_drafts(batch_name)
-    results["build_fee_purchase_invoice_drafts"] = build_fee_purchase_invoice_drafts(batch_name)
-    results["build_fee_receivable_sales_invoice_drafts"] = build_fee_receivable_sales_invoice_drafts(batch_name)
-    results["build_commercial_adjustment_returns"] = build_commercial_adjustment_returns(batch_name)
-    results["build_logistics_adjustment_purchase_invoices"] = build_logistics_adjustment_purchase_invoices(batch_name)
-
-    if include_payments:
-        results["build_payment_entry_drafts"] = build_payment_entry_drafts(batch_name)
-
-    results["summarize_batch_financials"] = summarize_batch_financials(batch_name)
-    results["summarize_transaction_view_financials"] = summarize_transaction_view_financials(batch_name)
-    results["reconcile_batch_by_statement"] = reconcile_batch_by_statement(batch_name)
+@frappe.whitelist()
+def get_batch_metrics(batch_name: str, step: str | None = None):
+    frappe.has_permission("Noon Import Batch", "read", batch_name, throw=True)
+
+    filters = {"batch": batch_name}
+    if step:
+        filters["step"] = step
+
+    rows = frappe.get_all(
+        "Noon Import Batch Metric",
+        filters=filters,
+        fields=[
+            "step",
+            "status",
+            "started_at",
+            "wall_time",
+            "query_count",
+            "query_time",
+            "rows_processed",
+            "documents_created",
+            "throughput",
+            "peak_rss_mb",
+            "rss_delta_mb",
+            "app_version",
+        ],
+        order_by="started_at asc, creation asc",
+        limit_page_length=0,
+    )
+
+    # most recent run of each step
+    latest = {}
+    for row in rows:
+        latest[row.step] = row
+
+    return {
+        "batch": batch_name,
+        "rows": rows,
+        "latest": list(latest.values()),
+    }
+
+
+BATCH_JOBS = {
+    "stage_batch_rows": ["stage_batch_rows"],
+    "run_full_draft_pipeline": PIPELINE_STEPS,
+}
+
+BATCH_JOB_TIMEOUT = 4 * 60 * 60
+
+
+def _batch_job_id(batch_name: str) -> str:
+    return f"noon_import_batch::{batch_name}"
+
+
+def _pipeline_job_id(batch_name: str, step: str) -> str:
+    return f"noon_import_batch::{batch_name}::{step}"
+
+
+def _batch_jobs_running(batch_name: str) -> bool:
+    return is_job_enqueued(_batch_job_id(batch_name)) or any(
+        is_job_enqueued(_pipeline_job_id(batch_name, step))
+        for step in PIPELINE_RUNNERS
+    )
+
+
+@frappe.whitelist()
+def enqueue_batch_job(batch_name: str, job: str = "run_full_draft_pipeline", include_payments: int = 0):
+    if job not in BATCH_JOBS:
+        frappe.throw(f"Unknown Noon batch job: {job}")
+
+    frappe.has_permission("Noon Import Batch", "write", batch_name, throw=True)
+
+    job_id = _batch_job_id(batch_name)
+    if _batch_jobs_running(batch_name):
+        frappe.throw("يوجد تشغيل قيد التنفيذ لهذه الدفعة بالفعل، يرجى الانتظار حتى ينتهي.")
+
+    frappe.db.set_value("Noon Import Batch", batch_name, {
+        "job_id": job_id,
+        "status": "Queued",
+    })
+
+    frappe.enqueue(
+        "epc_app.noon_integration.api.noon_import.execute_batch_job",
+        queue="long",
+        timeout=BATCH_JOB_TIMEOUT,
+        job_id=job_id,
+        deduplicate=True,
+        enqueue_after_commit=True,
+        batch_name=batch_name,
+        job=job,
+        include_payments=cint(include_payments),
+    )
 
     return {
         "batch": batch_name,
+        "job": job,
+        "job_id": job_id,
+    }
+
+
+PIPELINE_RESULT_FILES = {
+    "invoices_file": "ملف الفواتير والإشعارات الدائنة",
+    "transactions_file": "ملف الحركات",
+    "consolidated_file": "ملف الرسوم المجمعة",
+    "statement_detail_file": "ملف تفاصيل كشف نون",
+}
+
+PIPELINE_RESULT_DRAFTS = [
+    ("فواتير مبيعات", "build_sales_invoice_drafts"),
+    ("مرتجعات مبيعات", "build_sales_return_drafts"),
+    ("فواتير شراء رسوم", "build_fee_purchase_invoice_drafts"),
+    ("فواتير مبيعات رسوم مستحقة", "build_fee_receivable_sales_invoice_drafts"),
+    ("مرتجعات تعديلات تجارية", "build_commercial_adjustment_returns"),
+    ("فواتير شراء تعديلات لوجستية", "build_logistics_adjustment_purchase_invoices"),
+    ("سندات قبض", "build_payment_entry_drafts"),
+]
+
+
+def _failed_drafts(results: Dict[str, Any]) -> List[tuple]:
+    # (label, failed count, first failures) of each builder that left groups
+    # behind
+    out = []
+    for label, step in PIPELINE_RESULT_DRAFTS:
+        step_result = results.get(step) or {}
+        failed_count = cint(step_result.get("failed_count"))
+        if failed_count:
+            out.append((label, failed_count, step_result.get("failed_preview") or []))
+    return out
+
+
+def format_pipeline_result(result: Dict[str, Any] | None) -> str:
+    # The readable run summary stored in last_run_result
+    results = (result or {}).get("results") or {}
+    files = (results.get("analyze_batch") or {}).get("files") or {}
+    validation = results.get("validate_batch_ready") or {}
+    blocking_issues = validation.get("blocking_issues") or []
+    warnings = validation.get("warnings") or []
+    unresolved_count = cint(results.get("unresolved_item_mappings_count"))
+    unresolved_preview = results.get("unresolved_item_mappings_preview") or []
+    has_unresolved = unresolved_count > 0 or bool(results.get("missing_item_mapping_report"))
+    failed_drafts = _failed_drafts(results)
+
+    lines = ["نتيجة تشغيل دفعة نون", ""]
+
+    if blocking_issues:
+        lines += ["تعذر إنشاء المسودات", ""]
+
+        if has_unresolved:
+            lines += [
+                "المشكلة:",
+                "- يوجد أصناف من نون غير مربوطة بأصناف ERPNext بعد محاولة الربط التلقائي.",
+                "",
+                "العدد:",
+                f"- عدد الأصناف غير المربوطة: {unresolved_count}",
+            ]
+
+            if unresolved_preview:
+                lines += ["", "أول الأصناف التي ما زالت تحتاج ربطًا:"]
+                for row in unresolved_preview:
+                    sku = row.get("partner_sku") or row.get("sku") or "غير معروف"
+                    rows_count = cint(row.get("rows_count"))
+                    lines.append(f"- {sku} (عدد الصفوف: {rows_count})" if rows_count > 0 else f"- {sku}")
+
+            lines += [
+                "",
+                "ماذا يجب على المستخدم أن يفعل؟",
+                "- استكمال الربط في شاشة Noon Item Mapping",
+                "- ثم إعادة تشغيل المعالجة",
+            ]
+
+        lines.append("المشاكل المانعة:")
+        lines += [f"- {issue.get('message')}" for issue in blocking_issues]
+    elif failed_drafts:
+        lines += [
+            "الحالة:",
+            f"- تعذر إنشاء {sum(count for _label, count, _preview in failed_drafts)} مستند، "
+            "راجع الأخطاء أدناه ثم أعد التشغيل لإعادة المحاولة",
+        ]
+    else:
+        lines += ["الحالة:", "- الدفعة جاهزة وتم إنشاء المسودات بنجاح"]
+
+    lines += ["", "ملخص الملفات:"]
+    for key, label in PIPELINE_RESULT_FILES.items():
+        lines.append(f"- {label}: {cint((files.get(key) or {}).get('rows'))} صف")
+
+    lines += ["", "التحقق:"]
+    if blocking_issues:
+        lines += [f"- {issue.get('message')}" for issue in blocking_issues]
+    else:
+        lines.append("- لا توجد مشاكل مانعة")
+
+    if warnings:
+        stock_warning = next(
+            (warning for warning in warnings if warning.get("type") == "missing_stock_in_warehouse"), None
+        )
+        if stock_warning:
+            lines.append(
+                f"- يوجد {stock_warning.get('count')} تحذير متعلق بالمخزون، لكنه لا يمنع إنشاء المسودات المالية"
+            )
+        else:
+            lines.append(f"- يوجد {len(warnings)} تحذير يحتاج إلى مراجعة")
+
+        lines += ["", "التحذيرات:"]
+        lines += [f"- {warning.get('message')}" for warning in warnings]
+    else:
+        lines.append("- لا توجد تحذيرات")
+
+    if not blocking_issues:
+        lines += ["", "المستندات التي تم إنشاؤها:"]
+        for label, step in PIPELINE_RESULT_DRAFTS:
+            lines.append(f"- {label}: {cint((results.get(step) or {}).get('created_count'))}")
+
+        if failed_drafts:
+            lines += ["", "المستندات التي تعذر إنشاؤها:"]
+            for label, count, preview in failed_drafts:
+                lines.append(f"- {label}: {count}")
+                for d in preview:
+                    key = d.get("key")
+                    if isinstance(key, (list, tuple)):
+                        key = " / ".join(str(part) for part in key if part)
+                    lines.append(f"  - {key}: {d.get('error')}")
+
+        lines += [
+            "",
+            "ملاحظات:",
+            "- يمكن للمستخدم الآن مراجعة المسودات يدويًا قبل الاعتماد",
+            "- لم يتم ترحيل أي مستند تلقائيًا",
+        ]
+
+    return "\n".join(lines)
+
+
+def _finish_batch_job(batch_name: str, job: str, result: Dict[str, Any] | None, error: str | None = None):
+    results = (result or {}).get("results") or {}
+    if error:
+        status = "Failed"
+    elif _failed_drafts(results):
+        # every other group was built; the next run retries the failed ones
+        status = "Failed"
+    elif job == "stage_batch_rows" or (results.get("validate_batch_ready") or {}).get("ready"):
+        status = "Processed"
+    else:
+        status = "Analyzed"
+
+    if error:
+        last_run_result = error
+    elif job == "run_full_draft_pipeline":
+        last_run_result = format_pipeline_result(result)
+    else:
+        last_run_result = frappe.as_json(result)
+
+    frappe.db.set_value("Noon Import Batch", batch_name, {
+        "status": status,
+        "last_run_result": last_run_result,
+    })
+    frappe.db.commit()
+
+    # the form reloads to show last_run_result
+    progress = getattr(frappe.local, "noon_batch_progress", None)
+    if progress:
+        progress.publish(force=True, done=True, failed=status == "Failed")
+
+
+def execute_batch_job(batch_name: str, job: str, include_payments: int = 0):
+    start_progress(batch_name, job, BATCH_JOBS[job])
+
+    frappe.db.set_value("Noon Import Batch", batch_name, "status", "Running")
+    frappe.db.commit()
+
+    try:
+        if job == "stage_batch_rows":
+            result = _run_step({}, "stage_batch_rows", stage_batch_rows, batch_name)
+            _finish_batch_job(batch_name, job, result)
+            return result
+
+        _start_pipeline(batch_name, include_payments)
+    except Exception:
+        frappe.db.rollback()
+        _finish_batch_job(batch_name, job, None, frappe.get_traceback())
+        raise
+    finally:
+        stop_progress()
+
+
+# Pipeline state lives on Noon Import Batch.pipeline_state: the graph, the
+# status of every step that has been scheduled and the merged step results.
+# Step jobs update it under a row lock, so exactly one of them sees the
+# last running step finish and closes the batch.
+def _load_pipeline_state(batch_name: str, for_update: bool = False) -> Dict[str, Any]:
+    rows = frappe.db.sql(
+        f"""
+        select pipeline_state
+        from `tabNoon Import Batch`
+        where name = %s
+        {"for update" if for_update else ""}
+        """,
+        (batch_name,),
+    )
+    return frappe.parse_json(rows[0][0]) if rows and rows[0][0] else {}
+
+
+# Builder and summary results list every document and row they handled, and
+# pipeline_state is rewritten by each step under the batch row lock: it keeps
+# their counts, the full result stays on the step's Noon Import Batch Metric.
+# Validation and the *_preview lists are small and feed the run result as they
+# are.
+PIPELINE_STATE_FULL_RESULTS = ("validate_batch_ready", "unresolved_item_mappings_preview")
+
+
+def _state_result(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+
+    summary = {}
+    for key, item in value.items():
+        if isinstance(item, list) and not key.endswith("_preview"):
+            summary.setdefault(f"{key}_count", len(item))
+        else:
+            summary[key] = _state_result(item)
+    return summary
+
+
+def _save_pipeline_state(batch_name: str, state: Dict[str, Any]) -> None:
+    frappe.db.set_value(
+        "Noon Import Batch", batch_name, "pipeline_state", frappe.as_json(state), update_modified=False
+    )
+
+
+def _enqueue_pipeline_step(batch_name: str, step: str) -> None:
+    frappe.enqueue(
+        "epc_app.noon_integration.api.noon_import.execute_pipeline_step",
+        queue="long",
+        timeout=BATCH_JOB_TIMEOUT,
+        job_id=_pipeline_job_id(batch_name, step),
+        deduplicate=True,
+        batch_name=batch_name,
+        step=step,
+    )
+
+
+def _start_pipeline(batch_name: str, include_payments: int = 0) -> None:
+    include_payments = cint(include_payments)
+    state = {
         "include_payments": include_payments,
-        "results": results,
+        "graph": _pipeline_graph(include_payments),
+        "steps": {},
+        "results": {},
+        "errors": {},
     }
+    _advance_pipeline(batch_name, state)
+
+
+def _advance_pipeline(batch_name: str, state: Dict[str, Any]) -> None:
+    # Caller holds the row lock (or is the only writer, at start). Schedules
+    # every step whose dependencies are done; the job that finds nothing
+    # queued and nothing left to schedule closes the batch.
+    ready = _ready_steps(state)
+    for step in ready:
+        state["steps"][step] = "queued"
+
+    finished = not ready and "queued" not in state["steps"].values()
+
+    _save_pipeline_state(batch_name, state)
+    frappe.db.commit()
+
+    for step in ready:
+        _enqueue_pipeline_step(batch_name, step)
+
+    if finished:
+        result = {
+            "batch": batch_name,
+            "include_payments": state["include_payments"],
+            "results": state["results"],
+        }
+        error = "\n\n".join(f"{step}:\n{tb}" for step, tb in state["errors"].items()) or None
+        _finish_batch_job(batch_name, "run_full_draft_pipeline", result, error)
+
+
+def execute_pipeline_step(batch_name: str, step: str):
+    start_progress(batch_name, "run_full_draft_pipeline", PIPELINE_STEPS)
+
+    results = {}
+    error = None
+    failure = None
+    proceed = False
+    try:
+        proceed = PIPELINE_RUNNERS[step](batch_name, results)
+        frappe.db.commit()
+    except Exception as e:
+        frappe.db.rollback()
+        error = frappe.get_traceback()
+        failure = e
+
+    try:
+        state = _load_pipeline_state(batch_name, for_update=True)
+        state["results"].update({
+            key: value if key in PIPELINE_STATE_FULL_RESULTS else _state_result(value)
+            for key, value in results.items()
+        })
+        if error:
+            state["steps"][step] = "failed"
+            state["errors"][step] = error
+        else:
+            state["steps"][step] = "done"
+            if not proceed:
+                state["stopped"] = True
+
+        _advance_pipeline(batch_name, state)
+    finally:
+        stop_progress()
+
+    # the failure is recorded and the rest of the graph scheduled; the job
+    # itself still fails, so RQ keeps it in the failed registry
+    if failure:
+        raise failure
@@ -0,0 +1,103 @@
+from typing import Any, Dict
+
+import frappe
+
+from epc_app.noon_integration.api.noon_metrics import add_mapping_cache_lookup
+
+
+# Active Noon Item / Fee Mapping sets per company, shared across workers through
+# Redis. The mapping controllers clear a company's entries on every change, and
+# so does anything that writes mappings without going through the document.
+# Hits and misses are counted on the running step's metrics.
+MAPPING_CACHE_TTL = 24 * 60 * 60
+
+
+def _cache_key(kind: str, company: str) -> str:
+    return f"noon_mapping_cache::{kind}::{company}"
+
+
+def _load_item_map(company: str) -> Dict[str, str]:
+    return {
+        d.partner_sku: d.item_code
+        for d in frappe.get_all(
+            "Noon Item Mapping",
+            filters={"company": company, "is_active": 1},
+            fields=["partner_sku", "item_code"],
+            limit_page_length=0,
+        )
+    }
+
+
+def _load_fee_map(company: str) -> Dict[str, Dict[str, Any]]:
+    return {
+        d.fee_key: {
+            "item_code": d.item_code,
+            "expense_account": d.expense_account,
+            "income_account": d.income_account,
+            "direction": d.direction,
+        }
+        for d in frappe.get_all(
+            "Noon Fee Mapping",
+            filters={"company": company, "is_active": 1},
+            fields=["fee_key", "item_code", "expense_account", "income_account", "direction"],
+            limit_page_length=0,
+        )
+    }
+
+
+def _cleared() -> set | None:
+    return getattr(frappe.local, "noon_mapping_cache_cleared", None)
+
+
+def _get_cached(kind: str, company: str, loader):
+    cleared = _cleared()
+    if cleared and (company in cleared or "*" in cleared):
+        # this transaction changed the mappings: read them past the cache
+        return loader(company)
+
+    key = _cache_key(kind, company)
+
+    value = frappe.cache.get_value(key)
+    if value is not None:
+        add_mapping_cache_lookup(hit=True)
+        return value
+
+    add_mapping_cache_lookup(hit=False)
+    value = loader(company)
+    frappe.cache.set_value(key, value, expires_in_sec=MAPPING_CACHE_TTL)
+    return value
+
+
+def get_item_map(company: str) -> Dict[str, str]:
+    return _get_cached("item", company, _load_item_map)
+
+
+def get_fee_map(company: str) -> Dict[str, Dict[str, Any]]:
+    return _get_cached("fee", company, _load_fee_map)
+
+
+def clear_mapping_cache(company: str | None = None) -> None:
+    # Dropping the entries now would let another worker reload them from the
+    # rows this transaction has not committed yet, and cache the old mappings
+    # again. They are dropped once it commits; until then this transaction
+    # reads past the cache, and a rollback leaves the entries as they are.
+    cleared = _cleared()
+    if cleared is None:
+        cleared = frappe.local.noon_mapping_cache_cleared = set()
+        frappe.db.after_commit.add(_drop_cleared)
+        frappe.db.after_rollback.add(_forget_cleared)
+    cleared.add(company or "*")
+
+
+def _drop_cleared() -> None:
+    cleared = _forget_cleared()
+    if "*" in cleared:
+        frappe.cache.delete_keys("noon_mapping_cache::")
+    elif cleared:
+        frappe.cache.delete_value([_cache_key(kind, company) for company in cleared for kind in ("item", "fee")])
+
+
+def _forget_cleared() -> set:
+    cleared = _cleared() or set()
+    frappe.local.noon_mapping_cache_cleared = None
+    return cleared
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from typing import Any, Dict
+
+import frappe
+from frappe.utils import now_datetime
+
+import epc_app
+
+
+RSS_SAMPLE_INTERVAL = 0.25
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def current_rss_mb() -> float:
+    # resident set of this process; pool workers are separate processes and
+    # are not included
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+# Wall time, SQL count/time, rows and RSS of one pipeline step, saved as a
+# Noon Import Batch Metric record linked to the batch. SQL is measured by
+# wrapping frappe.db.sql for the duration of the step; RSS is sampled by a
+# background thread, so peak_rss_mb is the peak of this step rather than of
+# the whole worker process.
+class StepMetrics:
+    def __init__(self, batch_name: str, step: str):
+        self.batch_name = batch_name
+        self.step = step
+        self.started_at = None
+        self.wall_time = 0.0
+        self.query_count = 0
+        self.query_time = 0.0
+        self.rows = 0
+        self.documents = 0
+        self.normalize_hits = 0
+        self.normalize_misses = 0
+        self.mapping_cache_hits = 0
+        self.mapping_cache_misses = 0
+        self.status = "Success"
+        self.result = None
+        self.start_rss = 0.0
+        self.peak_rss = 0.0
+
+    def _sample_rss(self) -> None:
+        while not self.sampling_done.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, current_rss_mb())
+
+    def __enter__(self):
+        self.db = frappe.db
+        self.had_own_sql = "sql" in vars(self.db)
+        self.inner_sql = self.db.sql
+
+        def sql(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return self.inner_sql(*args, **kwargs)
+            finally:
+                self.query_count += 1
+                self.query_time += time.perf_counter() - start
+
+        self.db.sql = sql
+        self.previous = getattr(frappe.local, "noon_step_metrics", None)
+        frappe.local.noon_step_metrics = self
+        self.started_at = now_datetime()
+        self.start_rss = self.peak_rss = current_rss_mb()
+        self.sampling_done = threading.Event()
+        self.sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self.sampler.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_time = time.perf_counter() - self.start
+        self.sampling_done.set()
+        self.sampler.join()
+        self.peak_rss = max(self.peak_rss, current_rss_mb())
+        frappe.local.noon_step_metrics = self.previous
+        if self.had_own_sql:
+            self.db.sql = self.inner_sql
+        else:
+            del self.db.sql
+
+        if exc_type is None:
+            self.save()
+        else:
+            # the caller rolls the failed step back, which would take this
+            # record with it: write it once that rollback has happened, to be
+            # committed with the failure the caller records
+            self.status = "Failed"
+            frappe.db.after_rollback.add(self.save)
+        return False
+
+    def set_result(self, result: Any) -> None:
+        if not isinstance(result, dict):
+            return
+        self.result = result
+        self.documents = int(result.get("created_count") or 0)
+        if not self.rows:
+            # steps that do not report rows as they go: count what they handled
+            self.rows = sum(
+                int(result.get(key) or 0)
+                for key in ("created_count", "skipped_count", "failed_count", "inserted_rows")
+            )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "batch": self.batch_name,
+            "step": self.step,
+            "status": self.status,
+            "started_at": self.started_at,
+            "wall_time": round(self.wall_time, 3),
+            "query_count": self.query_count,
+            "query_time": round(self.query_time, 3),
+            "rows_processed": self.rows,
+            "documents_created": self.documents,
+            "throughput": round(self.rows / self.wall_time, 1) if self.wall_time > 0 else 0,
+            "peak_rss_mb": round(self.peak_rss, 1),
+            "rss_delta_mb": round(self.peak_rss - self.start_rss, 1),
+            "normalize_hits": self.normalize_hits,
+            "normalize_misses": self.normalize_misses,
+            "mapping_cache_hits": self.mapping_cache_hits,
+            "mapping_cache_misses": self.mapping_cache_misses,
+            "app_version": epc_app.__version__,
+        }
+
+    def save(self) -> None:
+        frappe.get_doc({
+            "doctype": "Noon Import Batch Metric",
+            **self.as_dict(),
+            # the step's full result, with the per-document lists the
+            # pipeline state leaves out
+            "result": frappe.as_json(self.result) if self.result is not None else None,
+        }).db_insert()
+
+
+def add_rows(count: int) -> None:
+    metrics = getattr(frappe.local, "noon_step_metrics", None)
+    if metrics:
+        metrics.rows += count
+
+
+def add_normalize_stats(stats: Dict[str, int]) -> None:
+    # fee key / statement number cache counters, reported by whichever process
+    # did the normalizing
+    metrics = getattr(frappe.local, "noon_step_metrics", None)
+    if metrics:
+        metrics.normalize_hits += stats.get("hits") or 0
+        metrics.normalize_misses += stats.get("misses") or 0
+
+
+def add_mapping_cache_lookup(hit: bool) -> None:
+    metrics = getattr(frappe.local, "noon_step_metrics", None)
+    if metrics:
+        if hit:
+            metrics.mapping_cache_hits += 1
+        else:
+            metrics.mapping_cache_misses += 1
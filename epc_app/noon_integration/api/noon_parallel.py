@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Tuple
+
+
+# Parsed CSV chunks are transformed in worker processes; the parent keeps the
+# database side. Below PARALLEL_MIN_BYTES of input the pool start-up costs more
+# than it saves and everything runs inline.
+PARALLEL_MAX_WORKERS = 8
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+
+def parallel_workers(total_bytes: int) -> int:
+    if total_bytes < PARALLEL_MIN_BYTES:
+        return 0
+    return min(PARALLEL_MAX_WORKERS, os.process_cpu_count() or 1)
+
+
+class ChunkPool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if not self.executor:
+            # never fork a worker that holds the site's DB and Redis connections
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return self.executor
+
+    def map(self, fn: Callable, tasks: Iterable[Tuple[Any, tuple]]) -> Iterator[Tuple[Any, Any]]:
+        # tasks are (tag, args) pairs; yields (tag, fn(*args)) in task order.
+        # At most two chunks per worker are in flight, so a large file is never
+        # read far ahead of the consumer.
+        if self.workers <= 1:
+            for tag, args in tasks:
+                yield tag, fn(*args)
+            return
+
+        executor = self._get_executor()
+        window = self.workers * 2
+        in_flight = deque()
+
+        for tag, args in tasks:
+            in_flight.append((tag, executor.submit(fn, *args)))
+            if len(in_flight) >= window:
+                tag, future = in_flight.popleft()
+                yield tag, future.result()
+
+        while in_flight:
+            tag, future = in_flight.popleft()
+            yield tag, future.result()
@@ -0,0 +1,212 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict
+from itertools import batched, chain
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import frappe
+from frappe.utils.file_manager import get_file_path
+
+
+# Parsed rows are cached as zlib-compressed JSON, stored in Redis as raw bytes
+# (frappe.cache.set/get, not set_value/get_value, which pickle), so nothing read
+# back from the shared Redis is ever unpickled. Files above PARSE_CACHE_MAX_FILE_BYTES
+# are too big to pin in Redis or in memory; they are spilled to gzipped JSON
+# lines under the site's private folder instead and read back chunk by chunk.
+PARSE_CACHE_MAX_FILE_BYTES = 64 * 1024 * 1024
+PARSE_CACHE_LOCAL_MAX_BYTES = 256 * 1024 * 1024
+PARSE_CACHE_TTL = 6 * 60 * 60
+PARSE_CHUNK_ROWS = 5000
+PARSE_SPILL_FOLDER = "noon_parse_cache"
+
+_local_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_local_cache_bytes = 0
+
+
+def _cache_key(content_hash: str) -> str:
+    return f"noon_parse_cache:v2::{content_hash}"
+
+
+def _file_content_hash(file_url: str, file_path: str) -> str:
+    content_hash = frappe.db.get_value("File", {"file_url": file_url}, "content_hash")
+    if content_hash:
+        return content_hash
+
+    digest = hashlib.md5()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _pack(header: List[str], rows: List[Sequence[str]]) -> bytes:
+    return zlib.compress(_dumps([header, rows]).encode("utf-8"), 1)
+
+
+def _unpack(blob: bytes) -> Tuple[List[str], List[List[str]]]:
+    header, rows = json.loads(zlib.decompress(blob))
+    return header, rows
+
+
+def _local_get(key: str) -> bytes | None:
+    blob = _local_cache.get(key)
+    if blob is not None:
+        _local_cache.move_to_end(key)
+    return blob
+
+
+def _local_put(key: str, blob: bytes) -> None:
+    global _local_cache_bytes
+
+    if len(blob) > PARSE_CACHE_LOCAL_MAX_BYTES:
+        return
+
+    old = _local_cache.pop(key, None)
+    if old is not None:
+        _local_cache_bytes -= len(old)
+
+    _local_cache[key] = blob
+    _local_cache_bytes += len(blob)
+
+    while _local_cache_bytes > PARSE_CACHE_LOCAL_MAX_BYTES and _local_cache:
+        _evicted_key, evicted = _local_cache.popitem(last=False)
+        _local_cache_bytes -= len(evicted)
+
+
+def _get_cached(key: str) -> bytes | None:
+    blob = _local_get(key)
+    if blob is not None:
+        return blob
+
+    blob = frappe.cache.get(frappe.cache.make_key(key))
+    if blob is not None:
+        _local_put(key, blob)
+    return blob
+
+
+def _put_cached(key: str, blob: bytes) -> None:
+    _local_put(key, blob)
+    frappe.cache.set(frappe.cache.make_key(key), blob, ex=PARSE_CACHE_TTL)
+
+
+def _iter_disk_rows(file_path: str) -> Iterator[List[str]]:
+    with open(file_path, "rb") as raw:
+        # utf-8-sig drops the BOM Noon puts on its exports; the wrapper decodes
+        # incrementally so only one buffer of the file is held at a time.
+        stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        for row in csv.reader(stream):
+            # csv.DictReader skips blank lines as well
+            if row:
+                yield row
+
+
+def _spill_path(content_hash: str) -> str:
+    folder = frappe.get_site_path("private", PARSE_SPILL_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{content_hash}.jsonl.gz")
+
+
+def _sweep_spilled(folder: str) -> None:
+    cutoff = time.time() - PARSE_CACHE_TTL
+    for entry in os.scandir(folder):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _iter_spilled(fh, size: int) -> Iterator[Tuple[List[str], Tuple[List[str], ...]]]:
+    # first line is the header, every other line a JSON list of rows
+    with fh:
+        header = json.loads(next(fh))
+        for chunk in batched(chain.from_iterable(map(json.loads, fh)), size, strict=False):
+            yield header, chunk
+
+
+def _iter_and_spill(
+    file_path: str,
+    path: str,
+    size: int,
+) -> Iterator[Tuple[List[str], Tuple[List[str], ...]]]:
+    rows = _iter_disk_rows(file_path)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    _sweep_spilled(os.path.dirname(path))
+
+    # written under a temporary name and moved in place once complete, so
+    # readers never see a partial file; abandoned runs leave nothing behind
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as fh:
+            fh.write(_dumps(header) + "\n")
+            for chunk in batched(rows, size, strict=False):
+                fh.write(_dumps(chunk) + "\n")
+                yield header, chunk
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def iter_csv_chunks(
+    file_url: str,
+    size: int = PARSE_CHUNK_ROWS,
+) -> Iterator[Tuple[List[str], Tuple[List[str], ...]]]:
+    # (header, rows) in blocks of `size` value lists; cheap to hand to a
+    # worker process, unlike one dict per row
+    if not file_url:
+        return
+
+    file_path = get_file_path(file_url)
+    content_hash = _file_content_hash(file_url, file_path)
+
+    if os.path.getsize(file_path) > PARSE_CACHE_MAX_FILE_BYTES:
+        path = _spill_path(content_hash)
+        try:
+            fh = gzip.open(path, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            yield from _iter_and_spill(file_path, path, size)
+        else:
+            yield from _iter_spilled(fh, size)
+        return
+
+    key = _cache_key(content_hash)
+
+    blob = _get_cached(key)
+    if blob is not None:
+        header, cached_rows = _unpack(blob)
+        for chunk in batched(cached_rows, size, strict=False):
+            yield header, chunk
+        return
+
+    rows = _iter_disk_rows(file_path)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    collected = []
+    for chunk in batched(rows, size, strict=False):
+        collected.extend(chunk)
+        yield header, chunk
+
+    # only reached when the caller consumed the whole file
+    _put_cached(key, _pack(header, collected))
+
+
+def iter_csv_rows(file_url: str) -> Iterator[Dict[str, Any]]:
+    for header, chunk in iter_csv_chunks(file_url):
+        for values in chunk:
+            yield dict(zip(header, values, strict=False))
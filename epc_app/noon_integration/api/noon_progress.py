@@ -0,0 +1,80 @@
+import time
+from typing import Any, Dict, List
+
+import frappe
+
+from epc_app.noon_integration.api.noon_metrics import add_rows
+
+
+PROGRESS_EVENT = "noon_batch_progress"
+PROGRESS_MIN_INTERVAL = 1.0
+
+
+class BatchProgress:
+    def __init__(self, batch_name: str, job: str, steps: List[str]):
+        self.batch_name = batch_name
+        self.job = job
+        self.steps = steps
+        self.step = None
+        self.step_started = time.monotonic()
+        self.rows = 0
+        self.last_published = 0.0
+
+    def start_step(self, step: str) -> None:
+        self.step = step
+        self.step_started = time.monotonic()
+        self.rows = 0
+        self.publish(force=True)
+
+    def add_rows(self, count: int) -> None:
+        self.rows += count
+        self.publish()
+
+    def publish(self, force: bool = False, **extra) -> None:
+        now = time.monotonic()
+        if not force and now - self.last_published < PROGRESS_MIN_INTERVAL:
+            return
+        self.last_published = now
+
+        elapsed = now - self.step_started
+        step_no = self.steps.index(self.step) + 1 if self.step in self.steps else 0
+
+        message: Dict[str, Any] = {
+            "batch": self.batch_name,
+            "job": self.job,
+            "step": self.step,
+            "step_no": step_no,
+            "steps_count": len(self.steps),
+            "rows_processed": self.rows,
+            "rows_per_sec": round(self.rows / elapsed, 1) if elapsed > 0 else 0,
+            **extra,
+        }
+
+        frappe.publish_realtime(
+            PROGRESS_EVENT,
+            message,
+            doctype="Noon Import Batch",
+            docname=self.batch_name,
+        )
+
+
+def start_progress(batch_name: str, job: str, steps: List[str]) -> BatchProgress:
+    frappe.local.noon_batch_progress = BatchProgress(batch_name, job, steps)
+    return frappe.local.noon_batch_progress
+
+
+def stop_progress() -> None:
+    frappe.local.noon_batch_progress = None
+
+
+def report_step(step: str) -> None:
+    progress = getattr(frappe.local, "noon_batch_progress", None)
+    if progress:
+        progress.start_step(step)
+
+
+def report_rows(count: int) -> None:
+    add_rows(count)
+    progress = getattr(frappe.local, "noon_batch_progress", None)
+    if progress:
+        progress.add_rows(count)
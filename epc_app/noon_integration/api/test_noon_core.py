@@ -0,0 +1,285 @@
+# Copyright (c) 2026, yahya basalama and Contributors
+# See license.txt
+
+import datetime
+import hashlib
+import unittest
+
+from epc_app.noon_integration.api import noon_core
+from epc_app.noon_integration.api.noon_core import (
+	SOURCE_CONSOLIDATED,
+	SOURCE_INVOICES,
+	SOURCE_STATEMENT_DETAIL,
+	SOURCE_TRANSACTIONS,
+	extract_statement_nr,
+	make_source_row_key,
+	normalize_fee_key,
+	parse_date,
+	reconcile_statement,
+	resolve_statement,
+	transform_chunk,
+)
+
+
+# noon_core has no frappe dependency, so these are plain unit tests: they run
+# under bench and with `python -m unittest` alike.
+
+
+def _baseline_row_key(*values):
+	# row key as staged before the 16-byte digest: full sha256 hex
+	normalized = ["" if value is None else str(value).strip() for value in values]
+	return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+
+def _transform(source_file, header, rows, start=1):
+	payloads, maps, _normalized = transform_chunk(source_file, "BATCH-1", header, rows, start)
+	return payloads, maps
+
+
+INVOICE_HEADER = [
+	"Document Type",
+	"Transaction Type",
+	"Document Date",
+	"Invoice Nr",
+	"Credit Note Nr",
+	"Source Doc Nr",
+	"Source Doc Line Nr",
+	"Partner SKU",
+	"Description",
+	"Misc",
+	"Price Excluding VAT (Document Currency)",
+	"VAT Amount (Document Currency)",
+	"Price Including VAT (Document Currency)",
+]
+
+
+class TestSourceRowKey(unittest.TestCase):
+	def test_key_is_32_hex_characters(self):
+		key = make_source_row_key("Invoice", "Customer", "INV-1")
+		self.assertEqual(len(key), 32)
+		int(key, 16)
+
+	def test_key_is_prefix_of_baseline_key(self):
+		values = ("Invoice", " Customer ", None, "INV-1", 12.5, "")
+		self.assertEqual(make_source_row_key(*values), _baseline_row_key(*values)[:32])
+
+	def test_none_and_blank_values_hash_alike(self):
+		self.assertEqual(make_source_row_key("A", None, "B"), make_source_row_key("A", "  ", "B"))
+
+	def test_value_order_matters(self):
+		self.assertNotEqual(make_source_row_key("A", "B"), make_source_row_key("B", "A"))
+
+
+class TestNormalizeFeeKey(unittest.TestCase):
+	def test_empty_values(self):
+		self.assertIsNone(normalize_fee_key(None))
+		self.assertIsNone(normalize_fee_key(""))
+		self.assertIsNone(normalize_fee_key("   "))
+
+	def test_statement_prefix_is_dropped(self):
+		self.assertEqual(normalize_fee_key("PS-123-AB: Referral  Fee"), "Referral Fee")
+
+	def test_prefix_without_colon_is_kept(self):
+		self.assertEqual(normalize_fee_key("PS-123 Referral Fee"), "PS-123 Referral Fee")
+
+	def test_whitespace_is_collapsed(self):
+		self.assertEqual(normalize_fee_key("  Storage\t\tFee \n monthly "), "Storage Fee monthly")
+
+	def test_capped_at_140_characters(self):
+		self.assertEqual(normalize_fee_key("x" * 200), "x" * 140)
+
+	def test_non_string_values(self):
+		self.assertEqual(normalize_fee_key(42), "42")
+
+
+class TestExtractStatementNr(unittest.TestCase):
+	def test_first_value_with_a_statement_wins(self):
+		self.assertEqual(extract_statement_nr(None, "order 1", "see PS-2024-07", "PS-1"), "PS-2024-07")
+
+	def test_no_statement(self):
+		self.assertIsNone(extract_statement_nr(None, "", "N123"))
+
+	def test_stops_at_first_invalid_character(self):
+		self.assertEqual(extract_statement_nr("PS-AB12-9/3"), "PS-AB12-9")
+
+
+class TestParseDate(unittest.TestCase):
+	def test_iso_date_and_datetime(self):
+		self.assertEqual(parse_date("2026-03-04"), datetime.date(2026, 3, 4))
+		self.assertEqual(parse_date("2026-03-04 10:11:12"), datetime.date(2026, 3, 4))
+		self.assertEqual(parse_date("2026-03-04T10:11:12.5"), datetime.date(2026, 3, 4))
+
+	def test_empty_and_zero_dates(self):
+		self.assertIsNone(parse_date(None))
+		self.assertIsNone(parse_date(""))
+		self.assertIsNone(parse_date("0001-01-01"))
+		self.assertIsNone(parse_date("0000-00-00"))
+
+	def test_other_layouts(self):
+		self.assertEqual(parse_date("March 4, 2026"), datetime.date(2026, 3, 4))
+
+	def test_bad_values(self):
+		self.assertIsNone(parse_date("not a date"))
+		self.assertIsNone(parse_date("2026-13-45"))
+
+
+class TestTransformChunk(unittest.TestCase):
+	def test_invoice_row_matches_baseline_staging(self):
+		row = (
+			"Invoice",
+			"Statement Fee",
+			"2026-03-04",
+			"INV-1",
+			"",
+			"N100",
+			"PS-77-A",
+			"SKU-1",
+			"PS-77-A:  Referral   Fee",
+			"",
+			"1,000.50",
+			"150.075",
+			"1150.575",
+		)
+		[payload], maps = _transform(SOURCE_INVOICES, INVOICE_HEADER, [row], start=5)
+
+		self.assertEqual(maps, {})
+		self.assertEqual(payload["source_row_key"], _baseline_row_key(
+			"Invoice", "Statement Fee", "INV-1", "", "N100", "PS-77-A", "SKU-1",
+			"Referral Fee", "1,000.50", "150.075", "1150.575",
+		)[:32])
+		self.assertEqual(payload["source_row_no"], 5)
+		self.assertEqual(payload["batch"], "BATCH-1")
+		self.assertEqual(payload["source_file"], SOURCE_INVOICES)
+		self.assertEqual(payload["status"], "Pending")
+		self.assertEqual(payload["document_type"], "Invoice")
+		self.assertEqual(payload["reference_nr"], "N100")
+		self.assertEqual(payload["order_nr"], "N100")
+		self.assertEqual(payload["item_nr"], "PS-77-A")
+		self.assertEqual(payload["fee_key"], "Referral Fee")
+		self.assertEqual(payload["amount"], 1000.5)
+		self.assertEqual(payload["vat_amount"], 150.075)
+		self.assertEqual(payload["gross_amount"], 1150.575)
+		self.assertEqual(payload["statement_nr"], "PS-77-A")
+
+	def test_fee_key_only_kept_for_its_transaction_type(self):
+		row = ("Invoice", "Customer", "", "INV-2", "", "N1", "1", "SKU-1", "Some  product", "", "10", "1.5", "11.5")
+		[payload], _maps = _transform(SOURCE_INVOICES, INVOICE_HEADER, [row])
+
+		self.assertIsNone(payload["fee_key"])
+		# the row key still hashes the normalized description
+		self.assertEqual(payload["source_row_key"], _baseline_row_key(
+			"Invoice", "Customer", "INV-2", "", "N1", "1", "SKU-1", "Some product", "10", "1.5", "11.5",
+		)[:32])
+
+	def test_statement_detail_keeps_every_fee_key(self):
+		header = ["statement_nr", "reference_nr", "order_nr", "item_nr", "fee_name", "partner_sku", "total_payment"]
+		[payload], _maps = _transform(
+			SOURCE_STATEMENT_DETAIL, header, [("PS-9", "R1", "N1", "1", " Storage  Fee ", "SKU-1", "-3")]
+		)
+
+		self.assertEqual(payload["fee_key"], "Storage Fee")
+		self.assertEqual(payload["transaction_type"], " Storage  Fee ")
+		self.assertEqual(payload["statement_nr"], "PS-9")
+		self.assertEqual(payload["amount"], -3.0)
+		self.assertEqual(payload["vat_amount"], 0.0)
+
+	def test_short_and_long_rows(self):
+		header = ["statement_nr", "invoice_nr", "creditnote_nr", "order_nr", "item_nr", "item_status",
+			"partner_sku", "total_payment"]
+		short, long = _transform(
+			SOURCE_CONSOLIDATED,
+			header,
+			[("PS-1", "INV-1"), ("PS-2", "INV-2", "", "N2", "1", "delivered", "SKU", "5", "extra")],
+		)[0]
+
+		self.assertIsNone(short["order_nr"])
+		self.assertEqual(short["amount"], 0.0)
+		self.assertEqual(short["source_row_key"], _baseline_row_key("PS-1", "INV-1", *[None] * 6)[:32])
+		self.assertEqual(long["amount"], 5.0)
+		self.assertEqual(long["transaction_type"], "delivered")
+
+	def test_consolidated_statement_map(self):
+		header = ["statement_nr", "invoice_nr", "creditnote_nr", "order_nr", "item_nr", "item_status",
+			"partner_sku", "total_payment"]
+		_payloads, maps = _transform(SOURCE_CONSOLIDATED, header, [
+			("PS-1", "INV-1", "", "N1", "1", "delivered", "SKU", "5"),
+			("PS-2", "INV-1", "CN-1", "N1", "1", "returned", "SKU", "-5"),
+			("", "INV-3", "", "N3", "1", "delivered", "SKU", "5"),
+		])
+
+		# the first statement seen for a number is kept
+		self.assertEqual(maps, {"statement_map": {"INV-1": "PS-1", "CN-1": "PS-2"}})
+
+	def test_transactions_order_update_and_statement_map(self):
+		header = ["Transaction Date", "Transaction Type", "Reference Nr", "Order Nr", "Partner SKUs", "Title",
+			"Total", *noon_core.ORDER_UPDATE_COMPONENTS.values()]
+		components = ["0", "-2", "-1", "0", "0", "0", "0", "0", "0"]
+		payloads, maps = _transform(SOURCE_TRANSACTIONS, header, [
+			("2026-03-04", "order_update", "PS-5 N1", "N1", "SKU", "", "-3", *components),
+			("2026-03-05", "order", "N2", "N2", "SKU", "", "10", *components),
+		])
+
+		update, order = payloads
+		self.assertEqual(update["transaction_date"], datetime.date(2026, 3, 4))
+		self.assertEqual(update["document_type"], "Transaction View")
+		self.assertEqual(update["referral_fee"], -2.0)
+		self.assertEqual(update["proposed_type"], "logistics_adjustment")
+		self.assertIsNone(order["proposed_type"])
+		self.assertNotIn("referral_fee", order)
+		self.assertIsNone(order["fee_key"])
+		self.assertEqual(maps, {"order_statement_map": {"N1": "PS-5"}})
+
+
+class TestResolveStatement(unittest.TestCase):
+	RULES = noon_core.REPORT_SCHEMAS[SOURCE_INVOICES]["resolve_statement"]
+	MAPS = {
+		"statement_map": {"INV-1": "PS-INV", "CN-1": "PS-CN"},
+		"order_statement_map": {"N1": "PS-ORDER"},
+	}
+
+	def resolve(self, **payload):
+		payload.setdefault("statement_nr", "PS-OWN")
+		return resolve_statement(payload, self.MAPS, self.RULES)
+
+	def test_invoice_number_first(self):
+		self.assertEqual(self.resolve(invoice_nr="INV-1", creditnote_nr="CN-1", order_nr="N1"), "PS-INV")
+
+	def test_credit_note_before_order(self):
+		self.assertEqual(self.resolve(invoice_nr="INV-9", creditnote_nr="CN-1", order_nr="N1"), "PS-CN")
+
+	def test_order_before_own_statement(self):
+		self.assertEqual(self.resolve(invoice_nr="INV-9", order_nr="N1"), "PS-ORDER")
+
+	def test_own_statement_last(self):
+		self.assertEqual(self.resolve(invoice_nr="INV-9", order_nr="N9"), "PS-OWN")
+		self.assertIsNone(self.resolve(statement_nr=None))
+
+
+class TestReconcileStatement(unittest.TestCase):
+	def test_expected_totals_and_difference(self):
+		result = reconcile_statement({
+			"statement_nr": "PS-1",
+			"sales": 1000,
+			"returns": -100,
+			"fee_payable": 150,
+			"fee_receivable": 20,
+			"order_total": 700,
+			"order_update_total": -10,
+			"statement_fee_total": 50,
+			"balance_transfer_total": 25,
+		})
+
+		self.assertEqual(result["doc_expected"], 770)
+		self.assertEqual(result["tx_expected"], 765)
+		self.assertEqual(result["difference"], 5)
+		self.assertEqual(result["statement_nr"], "PS-1")
+
+	def test_returns_count_as_positive_either_sign(self):
+		self.assertEqual(
+			reconcile_statement({"sales": 100, "returns": 30})["doc_expected"],
+			reconcile_statement({"sales": 100, "returns": -30})["doc_expected"],
+		)
+
+	def test_missing_sums_are_zero(self):
+		result = reconcile_statement({"statement_nr": "PS-1", "sales": None})
+		self.assertEqual((result["doc_expected"], result["tx_expected"], result["difference"]), (0, 0, 0))
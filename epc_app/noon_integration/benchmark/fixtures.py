@@ -0,0 +1,170 @@
+import os
+from typing import List, Tuple
+
+import frappe
+
+from epc_app.noon_integration.benchmark.generator import FEE_KEYS, generate_noon_reports, sku_code
+
+
+BENCHMARK_NAME = "Noon Benchmark"
+FEE_ITEM_CODE = "NOON-FEE-PAYABLE"
+
+
+def _first(doctype: str, filters: dict) -> str:
+    name = frappe.db.get_value(doctype, filters, "name", order_by="creation asc")
+    if not name:
+        frappe.throw(f"Noon benchmark needs at least one {doctype} matching {filters}")
+    return name
+
+
+# Every fixture helper appends what it inserts to `created`, as
+# (doctype, name), so teardown_benchmark_batch removes exactly that.
+def _insert(values: dict, created: List[Tuple[str, str]]) -> str:
+    doc = frappe.get_doc(values).insert(ignore_permissions=True)
+    created.append((doc.doctype, doc.name))
+    return doc.name
+
+
+def _ensure(doctype: str, name: str, values: dict, created: List[Tuple[str, str]]) -> str:
+    if not frappe.db.exists(doctype, name):
+        _insert({"doctype": doctype, **values}, created)
+    return name
+
+
+def _ensure_item(item_code: str, item_group: str, created: List[Tuple[str, str]]) -> None:
+    _ensure("Item", item_code, {
+        "item_code": item_code,
+        "item_name": item_code,
+        "item_group": item_group,
+        "stock_uom": "Nos",
+        "is_stock_item": 0,
+    }, created)
+
+
+def _ensure_profile(company: str, created: List[Tuple[str, str]]) -> str:
+    profile = frappe.db.get_value("Noon Marketplace Profile", {"marketplace_name": BENCHMARK_NAME, "company": company})
+    if profile:
+        return profile
+
+    customer = _ensure("Customer", BENCHMARK_NAME, {
+        "customer_name": BENCHMARK_NAME,
+        "customer_group": _first("Customer Group", {"is_group": 0}),
+        "territory": _first("Territory", {"is_group": 0}),
+    }, created)
+    supplier = _ensure("Supplier", BENCHMARK_NAME, {
+        "supplier_name": BENCHMARK_NAME,
+        "supplier_group": _first("Supplier Group", {"is_group": 0}),
+    }, created)
+
+    bank_ledger_account = _first("Account", {"company": company, "account_type": "Bank", "is_group": 0})
+    _ensure("Bank", BENCHMARK_NAME, {"bank_name": BENCHMARK_NAME}, created)
+    bank_account = frappe.db.get_value("Bank Account", {"bank": BENCHMARK_NAME, "company": company})
+    if not bank_account:
+        bank_account = _insert({
+            "doctype": "Bank Account",
+            "account_name": BENCHMARK_NAME,
+            "bank": BENCHMARK_NAME,
+            "company": company,
+            "account": bank_ledger_account,
+            "is_company_account": 1,
+        }, created)
+
+    return _insert({
+        "doctype": "Noon Marketplace Profile",
+        "marketplace_name": BENCHMARK_NAME,
+        "company": company,
+        "customer": customer,
+        "supplier": supplier,
+        "bank_account": bank_account,
+        "settlement_clearing_account": _first(
+            "Account", {"company": company, "account_type": "Receivable", "is_group": 0}
+        ),
+        "payable_account": _first("Account", {"company": company, "account_type": "Payable", "is_group": 0}),
+        "bank_ledger_account": bank_ledger_account,
+        "cost_center": frappe.get_cached_value("Company", company, "cost_center"),
+        "currency": frappe.get_cached_value("Company", company, "default_currency"),
+        "warehouse": _first("Warehouse", {"company": company, "is_group": 0}),
+    }, created)
+
+
+def _ensure_mappings(company: str, skus: int, seed: int, created: List[Tuple[str, str]]) -> None:
+    item_group = _first("Item Group", {"is_group": 0})
+    _ensure_item(FEE_ITEM_CODE, item_group, created)
+
+    for n in range(skus):
+        item_code = sku_code(seed, n)
+        _ensure_item(item_code, item_group, created)
+        if not frappe.db.exists("Noon Item Mapping", {"company": company, "partner_sku": item_code}):
+            _insert({
+                "doctype": "Noon Item Mapping",
+                "company": company,
+                "partner_sku": item_code,
+                "item_code": item_code,
+                "item_name": item_code,
+                "is_active": 1,
+            }, created)
+
+    expense_account = frappe.get_cached_value("Company", company, "default_expense_account")
+    income_account = frappe.get_cached_value("Company", company, "default_income_account")
+    for fee_key, direction in FEE_KEYS.items():
+        if not frappe.db.exists("Noon Fee Mapping", {"company": company, "fee_key": fee_key}):
+            _insert({
+                "doctype": "Noon Fee Mapping",
+                "company": company,
+                "fee_key": fee_key,
+                "direction": direction,
+                "item_code": FEE_ITEM_CODE,
+                "expense_account": expense_account,
+                "income_account": income_account,
+                "is_active": 1,
+            }, created)
+
+
+def _attach(path: str, created: List[Tuple[str, str]]) -> str:
+    # the generator writes straight into private/files; register the File
+    # without loading the content through the request layer
+    file_name = os.path.basename(path)
+    file_url = f"/private/files/{file_name}"
+    if not frappe.db.exists("File", {"file_url": file_url}):
+        _insert({
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": file_url,
+            "is_private": 1,
+        }, created)
+    return file_url
+
+
+def setup_benchmark_batch(rows: int = 1000, skus: int = 200, seed: int = 42, company: str | None = None):
+    company = company or frappe.defaults.get_global_default("company") or _first("Company", {})
+    created = []
+
+    profile = _ensure_profile(company, created)
+    _ensure_mappings(company, skus, seed, created)
+
+    generated = generate_noon_reports(frappe.get_site_path("private", "files"), rows=rows, skus=skus, seed=seed)
+
+    batch = frappe.get_doc({
+        "doctype": "Noon Import Batch",
+        "profile": profile,
+        "status": "Draft",
+        **{fieldname: _attach(path, created) for fieldname, path in generated["paths"].items()},
+    }).insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    return {"batch": batch.name, "profile": profile, "counts": generated["counts"], "created": created}
+
+
+def teardown_benchmark_batch(setup: dict, batches: List[str] | None = None) -> None:
+    # Staging commits, so tests cannot rely on a rollback: remove the batches
+    # (setup["batch"] and any in `batches`) with everything staged for them,
+    # then the documents setup_benchmark_batch inserted, newest first.
+    batches = [setup["batch"], *(batches or [])]
+    for doctype in ("Noon Import Row", "Noon Seen Row Key", "Noon Import Batch Metric"):
+        frappe.db.delete(doctype, {"batch": ("in", batches)})
+    for batch in batches:
+        frappe.delete_doc("Noon Import Batch", batch, force=True, ignore_permissions=True, ignore_missing=True)
+
+    for doctype, name in reversed(setup["created"]):
+        frappe.delete_doc(doctype, name, force=True, ignore_permissions=True, ignore_missing=True)
+    frappe.db.commit()
@@ -0,0 +1,212 @@
+import csv
+import os
+import random
+from datetime import date, timedelta
+from typing import Any, Dict
+
+
+# Column layouts of the four Noon exports, limited to what staging reads
+INVOICE_COLUMNS = [
+    "Document Type",
+    "Transaction Type",
+    "Document Date",
+    "Invoice Nr",
+    "Credit Note Nr",
+    "Source Doc Nr",
+    "Source Doc Line Nr",
+    "Partner SKU",
+    "Description",
+    "Misc",
+    "Price Excluding VAT (Document Currency)",
+    "VAT Amount (Document Currency)",
+    "Price Including VAT (Document Currency)",
+]
+
+TRANSACTION_COLUMNS = [
+    "Transaction Date",
+    "Transaction Type",
+    "Reference Nr",
+    "Order Nr",
+    "Partner SKUs",
+    "Title",
+    "Net Proceeds",
+    "Referral Fee",
+    "Fullfilment & Logistics Fees",
+    "Shipping Credits",
+    "Other Order Fees",
+    "Order Subsidies",
+    "Non-Order Fees",
+    "Non-Order Subsidies",
+    "Others",
+    "Total",
+]
+
+CONSOLIDATED_COLUMNS = [
+    "statement_nr",
+    "statement_date",
+    "invoice_nr",
+    "creditnote_nr",
+    "order_nr",
+    "item_nr",
+    "item_status",
+    "partner_sku",
+    "total_payment",
+]
+
+STATEMENT_DETAIL_COLUMNS = [
+    "statement_nr",
+    "last_statement_date",
+    "reference_nr",
+    "order_nr",
+    "item_nr",
+    "fee_name",
+    "partner_sku",
+    "total_payment",
+]
+
+# fee key -> Noon Fee Mapping direction
+FEE_KEYS = {
+    "Referral Fee": "Payable to Noon",
+    "Fulfilment Fee": "Payable to Noon",
+    "Storage Fee": "Payable to Noon",
+    "Marketing Support": "Receivable from Noon",
+}
+
+VAT_RATE = 0.15
+ORDERS_PER_STATEMENT = 500
+RETURN_RATE = 0.05
+ORDER_UPDATE_RATE = 0.03
+START_DATE = date(2026, 1, 1)
+
+
+def sku_code(seed: int, n: int) -> str:
+    return f"NBENCH{seed}-SKU-{n:05d}"
+
+
+def _money(value: float) -> str:
+    return f"{value:.2f}"
+
+
+def generate_noon_reports(directory: str, rows: int = 1000, skus: int = 200, seed: int = 42) -> Dict[str, Any]:
+    # `rows` is the number of order lines; the four files together hold
+    # roughly four times as many rows. The same arguments always produce
+    # byte-identical files.
+    rng = random.Random(seed)
+    prices = [round(rng.uniform(20, 900), 2) for _n in range(skus)]
+    prefix = f"NBENCH{seed}"
+
+    paths = {
+        "invoices_file": os.path.join(directory, f"{prefix}-{rows}-invoices.csv"),
+        "transactions_file": os.path.join(directory, f"{prefix}-{rows}-transactions.csv"),
+        "consolidated_file": os.path.join(directory, f"{prefix}-{rows}-consolidated.csv"),
+        "statement_detail_file": os.path.join(directory, f"{prefix}-{rows}-statement-detail.csv"),
+    }
+    counts = dict.fromkeys(paths, 0)
+
+    handles = {key: open(path, "w", newline="", encoding="utf-8") for key, path in paths.items()}
+    try:
+        writers = {key: csv.writer(fh) for key, fh in handles.items()}
+        writers["invoices_file"].writerow(INVOICE_COLUMNS)
+        writers["transactions_file"].writerow(TRANSACTION_COLUMNS)
+        writers["consolidated_file"].writerow(CONSOLIDATED_COLUMNS)
+        writers["statement_detail_file"].writerow(STATEMENT_DETAIL_COLUMNS)
+
+        def write(key, row):
+            writers[key].writerow(row)
+            counts[key] += 1
+
+        statements = (rows + ORDERS_PER_STATEMENT - 1) // ORDERS_PER_STATEMENT
+        for s in range(statements):
+            statement_nr = f"PS-{prefix}-{s + 1:05d}"
+            statement_date = (START_DATE + timedelta(days=7 * s)).isoformat()
+            fee_totals = dict.fromkeys(FEE_KEYS, 0.0)
+            payout = 0.0
+
+            first = s * ORDERS_PER_STATEMENT
+            for i in range(first, min(first + ORDERS_PER_STATEMENT, rows)):
+                order_nr = f"{prefix}-O{i + 1:08d}"
+                item_nr = f"{order_nr}-1"
+                reference_nr = f"{statement_nr}/{order_nr}"
+                order_date = (START_DATE + timedelta(days=7 * s + rng.randrange(7))).isoformat()
+                sku_no = rng.randrange(skus)
+                sku = sku_code(seed, sku_no)
+                price = prices[sku_no]
+                vat = round(price * VAT_RATE, 2)
+                gross = round(price + vat, 2)
+                referral = round(gross * 0.1, 2)
+                fulfilment = round(rng.uniform(5, 25), 2)
+                net = round(gross - referral - fulfilment, 2)
+                invoice_nr = f"{prefix}-INV-{i + 1:08d}"
+
+                write("invoices_file", [
+                    "Invoice", "Customer", order_date, invoice_nr, "", order_nr, item_nr, sku,
+                    "Sale", "", _money(price), _money(vat), _money(gross),
+                ])
+                write("consolidated_file", [
+                    statement_nr, statement_date, invoice_nr, "", order_nr, item_nr, "delivered", sku, _money(net),
+                ])
+                write("transactions_file", [
+                    order_date, "order", reference_nr, order_nr, sku, "Order",
+                    _money(net), _money(-referral), _money(-fulfilment), "0", "0", "0", "0", "0", "0", _money(net),
+                ])
+                for fee_name, amount in (("Referral Fee", referral), ("Fulfilment Fee", fulfilment)):
+                    write("statement_detail_file", [
+                        statement_nr, statement_date, reference_nr, order_nr, item_nr, fee_name, sku, _money(-amount),
+                    ])
+                fee_totals["Referral Fee"] += referral
+                fee_totals["Fulfilment Fee"] += fulfilment
+                payout += net
+
+                if rng.random() < RETURN_RATE:
+                    creditnote_nr = f"{prefix}-CN-{i + 1:08d}"
+                    write("invoices_file", [
+                        "Creditnote", "Customer", order_date, invoice_nr, creditnote_nr, order_nr, item_nr, sku,
+                        "Return", "", _money(price), _money(vat), _money(gross),
+                    ])
+                    write("consolidated_file", [
+                        statement_nr, statement_date, "", creditnote_nr, order_nr, item_nr, "returned", sku,
+                        _money(-net),
+                    ])
+                    payout -= net
+
+                if rng.random() < ORDER_UPDATE_RATE:
+                    # half commercial (net proceeds move), half logistics only
+                    if rng.random() < 0.5:
+                        adjustment = round(rng.uniform(5, price / 4), 2)
+                        components = [_money(-adjustment), "0", "0", "0", "0", "0"]
+                        total = -adjustment
+                    else:
+                        fee = round(rng.uniform(3, 15), 2)
+                        subsidy = round(rng.uniform(0, 3), 2)
+                        components = ["0", "0", _money(-fee), "0", "0", _money(subsidy)]
+                        total = subsidy - fee
+                    write("transactions_file", [
+                        order_date, "order_update", f"{reference_nr}/U", order_nr, sku, "Order Update",
+                        *components, "0", "0", "0", _money(total),
+                    ])
+                    payout += total
+
+            fee_totals["Storage Fee"] = round(rng.uniform(50, 500), 2)
+            fee_totals["Marketing Support"] = -round(rng.uniform(20, 200), 2)
+            fee_invoice_nr = f"{prefix}-FEE-{s + 1:05d}"
+            for fee_name, amount in fee_totals.items():
+                amount = round(abs(amount), 2)
+                vat = round(amount * VAT_RATE, 2)
+                write("invoices_file", [
+                    "Invoice", "Statement Fee", statement_date, fee_invoice_nr, "", "", "", "",
+                    f"{statement_nr}: {fee_name}", statement_nr, _money(amount), _money(vat), _money(amount + vat),
+                ])
+                write("transactions_file", [
+                    statement_date, "statement_fee", f"{statement_nr}/{fee_name}", "", "", fee_name,
+                    "0", "0", "0", "0", "0", "0", "0", "0", "0", _money(-amount),
+                ])
+
+            write("transactions_file", [
+                statement_date, "payment", f"{statement_nr}/payment", "", "", "Payout",
+                "0", "0", "0", "0", "0", "0", "0", "0", "0", _money(payout),
+            ])
+    finally:
+        for fh in handles.values():
+            fh.close()
+
+    return {"paths": paths, "counts": counts}
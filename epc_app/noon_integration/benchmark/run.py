@@ -0,0 +1,46 @@
+# Usage, on a local test site:
+#   bench --site test.local execute epc_app.noon_integration.benchmark.run.run --kwargs "{'rows': 100000}"
+from typing import Any, Dict, List
+
+import frappe
+
+from epc_app.noon_integration.api import noon_import
+from epc_app.noon_integration.api.noon_metrics import StepMetrics
+from epc_app.noon_integration.benchmark.fixtures import setup_benchmark_batch
+
+
+BENCHMARK_STEPS = [
+    ("analyze_batch", noon_import.analyze_batch),
+    ("stage_batch_rows", noon_import.stage_batch_rows),
+    ("validate_batch_ready", noon_import.validate_batch_ready),
+    *noon_import.PIPELINE_BUILDERS.items(),
+    ("reconcile_batch_by_statement", noon_import.reconcile_batch_by_statement),
+]
+
+
+def run_steps(batch_name: str) -> List[Dict[str, Any]]:
+    report = []
+    for step, fn in BENCHMARK_STEPS:
+        with StepMetrics(batch_name, step) as metrics:
+            metrics.set_result(fn(batch_name))
+        report.append(metrics.as_dict())
+    return report
+
+
+def print_report(batch_name: str, report: List[Dict[str, Any]]) -> None:
+    print(f"Noon benchmark | batch {batch_name}")
+    print(f"{'step':<46}{'wall s':>10}{'rows':>10}{'rows/s':>12}{'queries':>10}{'sql s':>10}{'rss MB':>10}")
+    for row in report:
+        print(
+            f"{row['step']:<46}{row['wall_time']:>10.3f}{row['rows_processed']:>10}{row['throughput']:>12.1f}"
+            f"{row['query_count']:>10}{row['query_time']:>10.3f}{row['peak_rss_mb']:>10.1f}"
+        )
+
+
+def run(rows: int = 1000, skus: int = 200, seed: int = 42, company: str | None = None):
+    setup = setup_benchmark_batch(rows=rows, skus=skus, seed=seed, company=company)
+    report = run_steps(setup["batch"])
+    print_report(setup["batch"], report)
+
+    frappe.db.commit()
+    return {**setup, "report": report}
@@ -4,6 +4,20 @@
 # import frappe
 from frappe.model.document import Document
 
+from epc_app.noon_integration.api.noon_core import normalize_fee_key
+from epc_app.noon_integration.api.noon_mapping_cache import clear_mapping_cache
+
 
 class NoonFeeMapping(Document):
-	pass
+	def validate(self):
+		# staged rows carry normalized fee keys; the fee builders join on them
+		self.fee_key = normalize_fee_key(self.fee_key)
+
+	def on_update(self):
+		before = self.get_doc_before_save()
+		if before and before.company != self.company:
+			clear_mapping_cache(before.company)
+		clear_mapping_cache(self.company)
+
+	def on_trash(self):
+		clear_mapping_cache(self.company)
@@ -1,9 +1,41 @@
 # Copyright (c) 2026, yahya basalama and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
+# Written by the background jobs straight to the database without touching
+# `modified`, so a form loaded before a job wrote them still passes the
+# timestamp check on save
+JOB_STATE_FIELDS = ("pipeline_state", "builder_checkpoints", "staged_stats", "new_rows", "known_rows")
+
+
 class NoonImportBatch(Document):
-	pass
+	def validate(self):
+		# keep the stored job state instead of the form's copy; read it under
+		# the row lock, so a job committing meanwhile is not missed
+		if self.is_new():
+			return
+
+		rows = frappe.db.sql(
+			f"""
+			select {", ".join(JOB_STATE_FIELDS)}
+			from `tabNoon Import Batch`
+			where name = %s
+			for update
+			""",
+			(self.name,),
+			as_dict=True,
+		)
+		if rows:
+			self.update(rows[0])
+
+	def on_trash(self):
+		# the profile's registry outlives the batch that first staged a line;
+		# the batch's step metrics go with it
+		frappe.db.sql(
+			"update `tabNoon Seen Row Key` set batch = null where batch = %s",
+			(self.name,),
+		)
+		frappe.db.delete("Noon Import Batch Metric", {"batch": self.name})
@@ -1,9 +1,16 @@
 # Copyright (c) 2026, yahya basalama and Contributors
 # See license.txt
 
-# import frappe
+import hashlib
+import tempfile
+
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from epc_app.noon_integration.api.noon_import import stage_batch_rows
+from epc_app.noon_integration.benchmark.fixtures import setup_benchmark_batch, teardown_benchmark_batch
+from epc_app.noon_integration.benchmark.generator import generate_noon_reports
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -12,6 +19,10 @@ EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
 
+def _digest(path):
+	with open(path, "rb") as fh:
+		return hashlib.md5(fh.read()).hexdigest()
+
 
 class IntegrationTestNoonImportBatch(IntegrationTestCase):
 	"""
@@ -19,4 +30,56 @@ class IntegrationTestNoonImportBatch(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	# Row keys are unique per source file across batches and staging commits:
+	# every test generates reports from its own seed and removes what it
+	# created, so a rerun stages the same lines again.
+	def setUp(self):
+		self.setup = None
+		self.batches = []
+
+	def tearDown(self):
+		if self.setup:
+			teardown_benchmark_batch(self.setup, self.batches)
+
+	def setup_batch(self, seed):
+		self.setup = setup_benchmark_batch(rows=300, skus=20, seed=seed)
+		return self.setup
+
+	def test_generator_is_deterministic(self):
+		with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+			a = generate_noon_reports(first, rows=300, skus=20, seed=7)
+			b = generate_noon_reports(second, rows=300, skus=20, seed=7)
+
+			self.assertEqual(a["counts"], b["counts"])
+			for fieldname, path in a["paths"].items():
+				self.assertEqual(_digest(path), _digest(b["paths"][fieldname]))
+
+	def test_stage_generated_batch(self):
+		setup = self.setup_batch(seed=1801)
+		batch = setup["batch"]
+
+		result = stage_batch_rows(batch)
+		self.assertEqual(result["inserted_rows"], sum(setup["counts"].values()))
+		self.assertEqual(frappe.db.count("Noon Import Row", {"batch": batch}), result["inserted_rows"])
+
+		# staging again replaces the batch rows instead of adding to them
+		stage_batch_rows(batch)
+		self.assertEqual(frappe.db.count("Noon Import Row", {"batch": batch}), result["inserted_rows"])
+
+	def test_incremental_batch_skips_known_lines(self):
+		setup = self.setup_batch(seed=1802)
+		first = frappe.get_doc("Noon Import Batch", setup["batch"])
+		total = stage_batch_rows(first.name)["inserted_rows"]
+
+		# the profile's registry remembers the lines after their rows are gone
+		frappe.db.delete("Noon Import Row", {"batch": first.name})
+
+		second = frappe.copy_doc(first)
+		second.incremental = 1
+		second.insert(ignore_permissions=True)
+		self.batches.append(second.name)
+
+		result = stage_batch_rows(second.name)
+		self.assertEqual(result["inserted_rows"], 0)
+		self.assertEqual(result["known_rows"], total)
+		self.assertEqual(frappe.db.get_value("Noon Import Batch", second.name, "known_rows"), total)
@@ -1,9 +1,36 @@
 # Copyright (c) 2026, yahya basalama and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class NoonImportRow(Document):
-	pass
+	def on_update(self):
+		before = self.get_doc_before_save()
+		if before and before.batch != self.batch:
+			clear_batch_stats(before.batch)
+		clear_batch_stats(self.batch)
+
+	def on_trash(self):
+		clear_batch_stats(self.batch)
+
+
+def clear_batch_stats(batch):
+	# staging keeps the batch aggregates in step itself; any other change to a
+	# row makes them stale, so the next summary rebuilds them with a scan
+	if batch:
+		frappe.db.set_value("Noon Import Batch", batch, "staged_stats", None, update_modified=False)
+
+
+def on_doctype_update():
+	frappe.db.add_index(
+		"Noon Import Row",
+		["batch", "source_file", "transaction_type", "document_type"],
+		index_name="batch_source_txn_doc_index",
+	)
+	frappe.db.add_unique(
+		"Noon Import Row",
+		["source_file", "source_row_key"],
+		constraint_name="unique_source_row_key",
+	)
@@ -1,9 +1,28 @@
 # Copyright (c) 2026, yahya basalama and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from epc_app.noon_integration.api.noon_mapping_cache import clear_mapping_cache
+
 
 class NoonItemMapping(Document):
-	pass
+	def on_update(self):
+		before = self.get_doc_before_save()
+		if before and before.company != self.company:
+			clear_mapping_cache(before.company)
+		clear_mapping_cache(self.company)
+
+	def on_trash(self):
+		clear_mapping_cache(self.company)
+
+
+def on_doctype_update():
+	# one mapping per partner SKU and company; bulk inserts of mappings rely
+	# on it to skip SKUs mapped in the meantime
+	frappe.db.add_unique(
+		"Noon Item Mapping",
+		["company", "partner_sku"],
+		constraint_name="unique_company_partner_sku",
+	)
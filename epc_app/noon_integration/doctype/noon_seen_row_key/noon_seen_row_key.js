@@ -0,0 +1,8 @@
+// Copyright (c) 2026, yahya basalama and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Noon Seen Row Key", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,22 @@
+# Copyright (c) 2026, yahya basalama and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+# Every Noon line a profile has staged, kept after its batch is restaged or
+# deleted; incremental batches skip the lines found here. While a line's Noon
+# Import Row exists the row itself already blocks it, so this registry only
+# matters once rows have been deleted. Deleting a batch clears `batch` on its
+# keys and keeps them.
+class NoonSeenRowKey(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Noon Seen Row Key",
+		["profile", "source_file", "source_row_key"],
+		constraint_name="unique_profile_source_row_key",
+	)
@@ -0,0 +1,82 @@
+# Copyright (c) 2026, yahya basalama and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from epc_app.noon_integration.api.noon_import import stage_batch_rows
+from epc_app.noon_integration.benchmark.fixtures import setup_benchmark_batch, teardown_benchmark_batch
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+class IntegrationTestNoonSeenRowKey(IntegrationTestCase):
+	"""
+	Integration tests for NoonSeenRowKey.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def setUp(self):
+		self.setup = setup_benchmark_batch(rows=100, skus=10, seed=2501)
+		self.profile = self.setup["profile"]
+		self.batches = []
+		self.keys = []
+
+	def tearDown(self):
+		# keys of a deleted batch no longer point at it
+		if self.keys:
+			frappe.db.delete("Noon Seen Row Key", {"profile": self.profile, "source_row_key": ("in", self.keys)})
+		teardown_benchmark_batch(self.setup, self.batches)
+
+	def registered_keys(self, batch):
+		return frappe.get_all(
+			"Noon Seen Row Key",
+			filters={"batch": batch},
+			pluck="source_row_key",
+			limit_page_length=0,
+		)
+
+	def test_staging_registers_each_line_once(self):
+		batch = self.setup["batch"]
+		total = stage_batch_rows(batch)["inserted_rows"]
+
+		keys = self.registered_keys(batch)
+		self.assertEqual(len(keys), total)
+		self.assertEqual(len(set(keys)), total)
+		self.assertEqual(
+			frappe.db.count("Noon Seen Row Key", {"profile": self.profile, "source_row_key": ("in", keys)}),
+			total,
+		)
+
+		# restaging replaces the rows but registers nothing new
+		stage_batch_rows(batch)
+		self.assertEqual(len(self.registered_keys(batch)), total)
+
+	def test_keys_outlive_their_batch(self):
+		first = frappe.get_doc("Noon Import Batch", self.setup["batch"])
+		total = stage_batch_rows(first.name)["inserted_rows"]
+		self.keys = self.registered_keys(first.name)
+
+		second = frappe.copy_doc(first)
+		second.incremental = 1
+		second.insert(ignore_permissions=True)
+		self.batches.append(second.name)
+
+		frappe.db.delete("Noon Import Row", {"batch": first.name})
+		frappe.delete_doc("Noon Import Batch", first.name, ignore_permissions=True)
+		frappe.db.commit()
+
+		self.assertEqual(
+			frappe.db.count("Noon Seen Row Key", {"profile": self.profile, "source_row_key": ("in", self.keys)}),
+			total,
+		)
+
+		# with the rows gone, only the registry knows these lines
+		result = stage_batch_rows(second.name)
+		self.assertEqual(result["inserted_rows"], 0)
+		self.assertEqual(result["known_rows"], total)
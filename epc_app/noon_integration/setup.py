@@ -0,0 +1,16 @@
+import frappe
+
+
+def add_noon_indexes():
+    # Indexes over the app-managed custom fields (see epc_app/custom/*.json).
+    # frappe.db.add_index skips indexes that already exist.
+    frappe.db.add_index(
+        "Sales Invoice",
+        ["custom_noon_import_batch", "is_return", "docstatus"],
+        index_name="noon_batch_return_docstatus_index",
+    )
+    frappe.db.add_index(
+        "Purchase Invoice",
+        ["custom_noon_import_batch", "docstatus"],
+        index_name="noon_batch_docstatus_index",
+    )
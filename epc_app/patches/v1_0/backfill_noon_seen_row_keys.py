@@ -0,0 +1,19 @@
+import frappe
+
+
+def execute():
+    # Register the lines staged before the registry existed, so the first
+    # incremental batch of a profile already knows them.
+    frappe.db.sql("""
+        insert ignore into `tabNoon Seen Row Key`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+            profile, source_file, source_row_key, batch)
+        select
+            r.name, r.creation, r.creation, r.owner, r.owner, 0, 0,
+            b.profile, r.source_file, r.source_row_key, r.batch
+        from `tabNoon Import Row` r
+        inner join `tabNoon Import Batch` b
+            on b.name = r.batch
+        where ifnull(b.profile, '') != ''
+            and ifnull(r.source_row_key, '') != ''
+    """)
@@ -0,0 +1,35 @@
+import frappe
+
+
+def execute():
+    # Rows staged before the unique constraint may repeat a key; keep one per
+    # key. Runs before model sync, because the sync creates the constraint
+    # (Noon Import Row on_doctype_update) and would fail on the duplicates.
+    if not frappe.db.table_exists("Noon Import Row") or not frappe.db.has_column(
+        "Noon Import Row", "source_row_key"
+    ):
+        return
+
+    # One grouping pass collects the repeated keys with the row to keep; the
+    # delete then probes that (indexed, small) table instead of joining the
+    # row table to itself.
+    frappe.db.sql("drop temporary table if exists `tmp_noon_row_key_keep`")
+    frappe.db.sql("""
+        create temporary table `tmp_noon_row_key_keep` (
+            index (source_file, source_row_key)
+        )
+        select source_file, source_row_key, min(name) as keep_name
+        from `tabNoon Import Row`
+        where ifnull(source_row_key, '') != ''
+        group by source_file, source_row_key
+        having count(*) > 1
+    """)
+    frappe.db.sql("""
+        delete r
+        from `tabNoon Import Row` r
+        inner join `tmp_noon_row_key_keep` k
+            on k.source_file = r.source_file
+            and k.source_row_key = r.source_row_key
+        where r.name != k.keep_name
+    """)
+    frappe.db.sql("drop temporary table `tmp_noon_row_key_keep`")
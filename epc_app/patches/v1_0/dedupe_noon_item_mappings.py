@@ -0,0 +1,32 @@
+import frappe
+
+
+def execute():
+    # Runs before model sync, which adds the unique (company, partner_sku)
+    # constraint. Of the mappings sharing a partner SKU in a company, keep the
+    # active one (the lowest name among several), else the lowest name.
+    if not frappe.db.table_exists("Noon Item Mapping"):
+        return
+
+    frappe.db.sql("drop temporary table if exists `tmp_noon_item_mapping_keep`")
+    frappe.db.sql("""
+        create temporary table `tmp_noon_item_mapping_keep` (
+            index (company, partner_sku)
+        )
+        select
+            company,
+            partner_sku,
+            coalesce(min(case when is_active = 1 then name end), min(name)) as keep_name
+        from `tabNoon Item Mapping`
+        group by company, partner_sku
+        having count(*) > 1
+    """)
+    frappe.db.sql("""
+        delete m
+        from `tabNoon Item Mapping` m
+        inner join `tmp_noon_item_mapping_keep` k
+            on k.company = m.company
+            and k.partner_sku = m.partner_sku
+        where m.name != k.keep_name
+    """)
+    frappe.db.sql("drop temporary table `tmp_noon_item_mapping_keep`")
@@ -0,0 +1,14 @@
+import frappe
+
+
+def execute():
+    # Row keys used to be the full sha256 hex digest; they are now its first 16
+    # bytes. Cut the stored keys down before the column shrinks to 32 chars.
+    if not frappe.db.table_exists("Noon Import Row"):
+        return
+
+    frappe.db.sql("""
+        update `tabNoon Import Row`
+        set source_row_key = left(source_row_key, 32)
+        where char_length(source_row_key) > 32
+    """)